@@ -0,0 +1,339 @@
+"""
+parse_reference.pyの解析処理のベンチマーク。
+MMLがなくても計測できるよう、Mizarの記事に似せた合成mizファイルを生成して使う。
+各段階(ファイルの読み込み、make_quotation_dict、extract_quoted_parts、整数IDへの変換、reformat_quotation_dict)の
+処理速度(行/秒、記事/秒)とピークメモリを計測し、結果をJSONで保存する。
+
+例:
+    python benchmark_parser.py --articles 200 --output bench.json
+    python benchmark_parser.py --articles 200 --compare bench.json  # 前回より遅くなっていれば終了コード1
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import parse_reference
+
+
+def generate_article(file_name, n_theorems, n_definitions, other_articles, rnd):
+    """
+    合成mizファイルの中身を生成する。
+    次の要素を含む。
+        ・environ部
+        ・ラベル付き・ラベルなしのtheorem(1行のby、複数行に渡るby、from、.=の連鎖、proof～end;)
+        ・definition(複数行のdefpred、means/equals、:DefN:ラベル、existence等の証明)
+        ・::$CT、::$CDとコメント行
+    Args:
+        file_name: 記事の名前(例:ART_0)
+        n_theorems: theoremの数
+        n_definitions: definitionの数
+        other_articles: 引用先に使う他の記事の名前のリスト
+        rnd: random.Random
+    Return:
+        ファイルの中身(str)
+    """
+    lines = [":: " + file_name + " (synthetic article)\n", "\n", "environ\n", "\n"]
+    for category in ("vocabularies", "notations", "constructors", "theorems", "schemes"):
+        imports = rnd.sample(other_articles, min(3, len(other_articles))) or ["TARSKI"]
+        lines.append(" " + category + " " + ", ".join(imports) + ";\n")
+    lines += ["\n", "begin\n", "\n"]
+
+    th_labels = list()
+    def_labels = list()
+
+    def ref():
+        """引用を1つ選ぶ(同じ記事のラベルか、他の記事の定理・定義)"""
+        r = rnd.random()
+        if r < 0.35 and th_labels:
+            return rnd.choice(th_labels)
+        if r < 0.5 and def_labels:
+            return rnd.choice(def_labels)
+        article = rnd.choice(other_articles) if other_articles else "TARSKI"
+        if r < 0.8:
+            return article + ":" + str(rnd.randint(1, 50))
+        return article + ":def " + str(rnd.randint(1, 20))
+
+    def refs(k):
+        return ", ".join(ref() for _ in range(k))
+
+    # theoremとdefinitionを混ぜて並べる
+    items = ["theorem"] * n_theorems + ["definition"] * n_definitions
+    rnd.shuffle(items)
+    th_count = 0
+    def_count = 0
+    for item in items:
+        r = rnd.random()
+        if r < 0.03:
+            lines += ["::$CT " + str(rnd.randint(1, 3)) + "\n", "\n"]
+        elif r < 0.05:
+            lines += ["::$CD\n", "\n"]
+        elif r < 0.1:
+            lines += [":: comment mentioning by and means\n"]
+
+        if item == "theorem":
+            th_count += 1
+            label = "Th" + str(th_count)
+            if rnd.random() < 0.8:
+                lines.append("theorem " + label + ":\n")
+            else:
+                lines.append("theorem\n")
+            shape = rnd.random()
+            if shape < 0.4:
+                lines.append("  for x being set holds x = x by " + refs(rnd.randint(1, 4)) + ";\n")
+            elif shape < 0.55:
+                lines.append("  for x being set holds P[x] from " + article_scheme(other_articles, rnd)
+                             + "(" + refs(1) + ");\n")
+            else:
+                lines += ["  for X being set holds X c= X\n", "proof\n", "  let X be set;\n"]
+                for i in range(rnd.randint(1, 6)):
+                    step = rnd.random()
+                    if step < 0.5:
+                        lines.append("  A" + str(i) + ": X = X by " + refs(rnd.randint(1, 3)) + ";\n")
+                    elif step < 0.75:
+                        lines += ["  A" + str(i) + ": X c= X by " + refs(2) + ",\n",
+                                  "    " + refs(rnd.randint(1, 2)) + ";\n"]
+                    else:
+                        lines += ["  X = X by " + refs(1) + "\n",
+                                  "  .= X by " + refs(1) + "\n",
+                                  "  .= X by " + refs(1) + ";\n"]
+                lines += ["  thus thesis by " + refs(2) + ";\n", "end;\n"]
+            lines.append("\n")
+            th_labels.append(label)
+        else:
+            def_count += 1
+            label = "Def" + str(def_count)
+            lines += ["definition\n", "  let X be set;\n"]
+            if rnd.random() < 0.3:
+                lines += ["  defpred P[object] means\n", "    $1 in X;\n"]
+            if rnd.random() < 0.7:
+                lines += ["  func F" + str(def_count) + "(X) -> set means\n",
+                          ":" + label + ": for x being object holds x in it iff x in X;\n",
+                          "  existence\n", "  proof\n",
+                          "    thus thesis by " + refs(rnd.randint(1, 3)) + ";\n",
+                          "  end;\n",
+                          "  uniqueness by " + refs(2) + ",\n",
+                          "    " + refs(1) + ";\n"]
+            else:
+                lines += ["  func G" + str(def_count) + "(X) -> set equals\n",
+                          ":" + label + ": X;\n",
+                          "  coherence by " + refs(1) + ";\n"]
+            lines += ["end;\n", "\n"]
+            def_labels.append(label)
+
+    return "".join(lines)
+
+
+def article_scheme(other_articles, rnd):
+    """from で使うスキームの名前を作る(例:"ART_1:sch 2")"""
+    article = rnd.choice(other_articles) if other_articles else "TARSKI"
+    return article + ":sch " + str(rnd.randint(1, 5))
+
+
+def generate_corpus(n_articles, n_theorems, n_definitions, seed):
+    """
+    合成mizファイルをn_articles個生成する。
+    Args:
+        n_articles: 記事の数
+        n_theorems: 1記事あたりのtheoremの数
+        n_definitions: 1記事あたりのdefinitionの数
+        seed: 乱数の種
+    Return:
+        {ファイル名(例:"art_0.miz"): 中身(str)} の辞書
+    """
+    rnd = random.Random(seed)
+    corpus = dict()
+    names = list()
+    for i in range(n_articles):
+        name = "ART_" + str(i)
+        corpus[name.lower() + ".miz"] = generate_article(name, n_theorems, n_definitions, names[-20:], rnd)
+        names.append(name)
+    return corpus
+
+
+def write_corpus(corpus, mml_dir):
+    """
+    generate_corpus()で生成したmizファイルをmml_dirに書き出す。
+    """
+    mml_dir = Path(mml_dir)
+    mml_dir.mkdir(parents=True, exist_ok=True)
+    for miz_file, text in corpus.items():
+        (mml_dir / miz_file).write_text(text, encoding="utf-8")
+
+
+def measure(func, repeat):
+    """
+    funcを実行し、実行時間(repeat回の最小値)とピークメモリを計測する。
+    tracemallocを有効にすると処理が遅くなるので、メモリの計測は時間の計測とは別に1回だけ行う。
+    Args:
+        func: 引数なしで呼び出す関数
+        repeat: 時間を計測する回数
+    Return:
+        (秒数(float), ピークメモリ(byte), funcの戻り値)
+    """
+    seconds = float("infinity")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run_benchmark(n_articles, n_theorems, n_definitions, seed=0, repeat=3):
+    """
+    合成コーパスを生成し、parse_referenceの各段階を計測する。
+    Return:
+        計測結果の辞書(JSONにそのまま書き出せる)
+    """
+    corpus = generate_corpus(n_articles, n_theorems, n_definitions, seed)
+    n_lines = sum(text.count("\n") for text in corpus.values())
+    n_bytes = sum(len(text.encode("utf-8")) for text in corpus.values())
+    stages = dict()
+
+    def record(stage, seconds, peak, items=None):
+        stages[stage] = {
+            "seconds": seconds,
+            "lines_per_sec": n_lines / seconds if seconds else None,
+            "articles_per_sec": n_articles / seconds if seconds else None,
+            "peak_memory_bytes": peak
+        }
+        if items is not None:
+            stages[stage]["items"] = items
+            stages[stage]["items_per_sec"] = items / seconds if seconds else None
+
+    with tempfile.TemporaryDirectory() as mml_dir:
+        write_corpus(corpus, mml_dir)
+        mizfiles = parse_reference.get_mizfiles_name(mml_dir)
+
+        # ファイルの読み込み(1行ずつ読むだけ)
+        def read_all():
+            for m in mizfiles:
+                _, text_lines = parse_reference.read_miz_file(m, mml_dir)
+                for _ in text_lines:
+                    pass
+        record("read", *measure(read_all, repeat)[:2])
+
+    articles = [(m[0:-4].upper(), text.splitlines(keepends=True)) for m, text in corpus.items()]
+
+    def quotation_all():
+        quotation_dict = dict()
+        for file_name, text_lines in articles:
+            parse_reference.make_quotation_dict(file_name, text_lines, quotation_dict)
+        return quotation_dict
+    seconds, peak, quotation_dict = measure(quotation_all, repeat)
+    record("make_quotation_dict", seconds, peak)
+
+    # extract_quoted_partsは引用部の文字列ごとに計測する
+    label_dict = {"Th" + str(i): str(i) for i in range(1, n_theorems + 1)}
+    label_dict.update({"Def" + str(i): "def" + str(i) for i in range(1, n_definitions + 1)})
+    quoted_parts = list()
+    for _, text_lines in articles:
+        for line in text_lines:
+            m = parse_reference.QUOTED_PART_PATTERN.search(line)
+            if m:
+                quoted_parts.append(m.group())
+
+    def extract_all():
+        for quoted_part in quoted_parts:
+            parse_reference.extract_quoted_parts(quoted_part, label_dict, "ART_0")
+    seconds, peak, _ = measure(extract_all, repeat)
+    record("extract_quoted_parts", seconds, peak, items=len(quoted_parts))
+
+    seconds, peak, quotation_table = measure(
+        lambda: parse_reference.QuotationTable.from_quotation_dict(quotation_dict), repeat)
+    record("QuotationTable", seconds, peak, items=len(quotation_table.symbols))
+
+    seconds, peak, nodes = measure(lambda: parse_reference.reformat_quotation_dict(quotation_table), repeat)
+    record("reformat_quotation_dict", seconds, peak, items=len(nodes))
+
+    return {
+        "parser_version": parse_reference.PARSER_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "articles": n_articles,
+            "theorems": n_theorems,
+            "definitions": n_definitions,
+            "seed": seed,
+            "repeat": repeat
+        },
+        "corpus": {"articles": n_articles, "lines": n_lines, "bytes": n_bytes, "nodes": len(nodes)},
+        "stages": stages
+    }
+
+
+def print_summary(result):
+    """計測結果を表にして表示する"""
+    corpus = result["corpus"]
+    print(f"corpus: {corpus['articles']} articles, {corpus['lines']} lines, {corpus['nodes']} nodes")
+    print(f"{'stage':<26}{'seconds':>10}{'lines/s':>14}{'articles/s':>12}{'peak MiB':>10}")
+    for stage, r in result["stages"].items():
+        print(f"{stage:<26}{r['seconds']:>10.4f}{r['lines_per_sec']:>14,.0f}"
+              f"{r['articles_per_sec']:>12,.1f}{r['peak_memory_bytes'] / 2 ** 20:>10.2f}")
+
+
+def compare_results(baseline, result, threshold):
+    """
+    前回の計測結果と比較し、threshold(割合)以上遅くなった段階を返す。
+    Return:
+        [(段階の名前, 前回の秒数, 今回の秒数), ...]
+    """
+    regressions = list()
+    for stage, r in result["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base and r["seconds"] > base["seconds"] * (1 + threshold):
+            regressions.append((stage, base["seconds"], r["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parse_referenceのベンチマーク")
+    parser.add_argument("--articles", type=int, default=100, help="生成する記事の数")
+    parser.add_argument("--theorems", type=int, default=60, help="1記事あたりのtheoremの数")
+    parser.add_argument("--definitions", type=int, default=15, help="1記事あたりのdefinitionの数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--repeat", type=int, default=3, help="各段階を計測する回数(最小値を採用)")
+    parser.add_argument("-o", "--output", default=None, help="計測結果を書き出すJSONファイル")
+    parser.add_argument("--compare", default=None, help="比較する前回の計測結果のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="--compareで遅くなったとみなす割合(0.2なら20%%)")
+    parser.add_argument("--write-corpus", default=None,
+                        help="生成した合成mizファイルを書き出すディレクトリ(計測はしない)")
+    args = parser.parse_args()
+
+    if args.write_corpus:
+        write_corpus(generate_corpus(args.articles, args.theorems, args.definitions, args.seed), args.write_corpus)
+        return
+
+    result = run_benchmark(args.articles, args.theorems, args.definitions, args.seed, args.repeat)
+    print_summary(result)
+
+    if args.output:
+        with open(args.output, mode='w') as f:
+            json.dump(result, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, result, args.threshold)
+        for stage, before, after in regressions:
+            print(f"regression: {stage} {before:.4f}s -> {after:.4f}s")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,21 @@
 """
 import networkx as nx
 import json
-from collections import defaultdict
+from array import array
+from collections import defaultdict, deque
+import functools
 import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# リポジトリ直下のモジュール(stage_trace.py等)を読み込めるようにする
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from reference_graph import load_nodes
+from stage_trace import NULL_TRACER, StageTracer
+from layered_graph import LayeredGraph, count_inversions, place_at_idealx
+from node_store import NodeStore
 
 
 class Node:
@@ -22,7 +35,9 @@ class Node:
         x, y: ノードの座標(x,y)。ともにint()。デフォルトは-1。
         href: ノードのリンク。str()。デフォルトは空列 ""。
         is_dummy: ノードがダミーか否か。bool()。デフォルトはFalse。
+    ダミーノードを含めるとノードの数が多くなるので、__slots__で1個あたりのメモリを減らしている。
     """
+    __slots__ = ("name", "targets", "sources", "x", "y", "href", "is_dummy")
 
     def __init__(self, name, targets=None, sources=None, x=None, y=None, href=None, is_dummy=None):
         self.name = name
@@ -96,109 +111,158 @@ def create_node_list(input_node_dict):
         ・x, y: -1。int。
         ・href: INPUT_NODE_DICTのvalueの第二要素。str。
         ・is_dummy: False。bool。
+    入力は1回だけ走査するので、load_input_nodes()が返すイテレータのように
+    (key, value)を1つずつ返すものも受け取れる。
 
     Args:
         input_node_dict: 入力されたノードの関係を示す辞書型データ。
                          ノードの名前をキーに持ち、値としてリストを持つ。リストの要素は次のようになる。
                              第1要素: keyのノードが指すノードの集合。set()
                              第2要素: keyのノードのリンク先URL。str()
+                         辞書の代わりに(key, value)のタプルのiterableでもよい。
 
     Returns:
         インスタンス化されたノードのリスト。
     """
+    items = input_node_dict.items() if isinstance(input_node_dict, dict) else input_node_dict
     node_list = []
     name2node = {}
-    # node_dict, node_listの作成
-    # k: ノードの名前(str)、v[1]: ノードkのリンクURL(str)
-    for k, v in input_node_dict.items():
-        n = Node(name=k, href=v[1])
-        name2node[k] = n
+    # k: ノードの名前(str)、v[0]: ノードkがターゲットとするノードの名前(str)の集合、v[1]: ノードkのリンクURL(str)
+    for k, v in items:
+        n = name2node.get(k)
+        if n is None:
+            n = Node(name=k)
+            name2node[k] = n
+        n.href = v[1]
         node_list.append(n)
 
-    # targetsの作成
-    # k: ノードの名前(str)、v[0]: ノードkがターゲットとするノードの名前(str)の集合
-    for k, v in input_node_dict.items():
+        # targets, sourcesの作成。まだ現れていないターゲットは先にNodeを作っておく
         for target in v[0]:
-            name2node[k].targets.add(name2node[target])
-
-    # sourcesの作成
-    # k: ノードの名前(str)、v: ノードkのNodeオブジェクト(object)
-    for k, v in name2node.items():
-        for target in v.targets:
-            target.sources.add(name2node[k])
+            t = name2node.get(target)
+            if t is None:
+                t = Node(name=target)
+                name2node[target] = t
+            n.targets.add(t)
+            t.sources.add(n)
+
+    # 入力のkeyに現れないターゲットは存在しないノードへの参照
+    if len(name2node) != len(node_list):
+        listed = set(node_list)
+        missing = [k for k, v in name2node.items() if v not in listed]
+        raise KeyError(missing[0])
     return node_list
 
 
-"""
-間引き
-"""
-
-def remove_waste_edges(nodes):
+def load_input_nodes(path):
     """
-    エッジの間引きを行う。
-    各ノードのターゲットから、間引いてよいターゲットを見つけ、間引く。
+    parse_reference.pyの出力ファイルを読み込み、create_node_list()に渡せる(key, value)を1ノードずつ返す。
+    読み込みはreference_graph.load_nodes()で行うので、同じ形式(.json, .ndjson, .csr, .sqlite)を読める。
+    .json以外はファイル全体をメモリに載せない。
+
     Args:
-        nodes: 間引きを行いたいノード(1個以上)
-    Return:
+        path: nodes1.json, nodes1.ndjson, nodes1.csr, nodes1.sqlite等のパス。
+
+    Returns:
+        (ノードの名前, [参照先の名前の集合, URL])を返すイテレータ。
     """
-    node2ancestors = dict()  # key=node, value=keyの全祖先
-    for node in nodes:
-        make_node2ancestors_recursively(node, node2ancestors)
-        waste_edge_list = search_waste_edges(node, node2ancestors)
-        for source, target in waste_edge_list:
-            source.targets.remove(target)
-            target.sources.remove(source)
+    for name, dependencies, url in load_nodes(path):
+        yield name, [set(dependencies), url]
 
 
-def make_node2ancestors_recursively(node, node2ancestors):
+def load_previous_layout(path):
     """
-    key=node, value=keyの全祖先のノードのセット
-    となる辞書を作る。
+    以前にmain()(virtual=Trueまたはworkersを指定)が出力したdemo_sample.jsonを読み込む。
+    ダミーノードは読み飛ばす。
     Args:
-        node: 全祖先を知りたいノード
-        node2ancestors: key=ノード, value=keyの全祖先のセット．変更される可能性あり．
-    Return:
-        nodeの全祖先ノード郡．set()
+        path: cytoscape.jsの記述形式のファイル(layered_graph.LayeredGraph.to_cytoscape()の出力)のパス
+    Returns:
+        (key=ノードの名前, value=(x, y) の辞書, key=(ソースの名前, ターゲットの名前), value="bends"のリスト の辞書)
+        "bends"のないエッジのvalueは空リスト。
     """
-    if not node.targets:
-        node2ancestors[node] = set()
-        return set()
-
-    elif node in node2ancestors.keys():
-        return node2ancestors[node]
-
-    ancestors = set()
-    for target in node.targets:
-        assert(target.name != node.name)
-        ancestors = ancestors | {target}
-        if target in node2ancestors.keys():
-            ancestors = ancestors | node2ancestors[target]
-        else:
-            ancestors = ancestors | make_node2ancestors_recursively(target, node2ancestors)
-    node2ancestors[node] = ancestors
-    return ancestors
+    with open(path) as f:
+        elements = json.load(f)["elements"]
+    name2xy = {node["data"]["name"]: (node["data"]["x"], node["data"]["y"])
+               for node in elements["nodes"] if not node["data"].get("is_dummy")}
+    edge2bends = {(edge["data"]["source"], edge["data"]["target"]): edge["data"].get("bends", [])
+                  for edge in elements["edges"]}
+    return name2xy, edge2bends
 
 
+"""
+間引き
+"""
 
-def search_waste_edges(node, node2ancestors):
+def remove_waste_edges(nodes):
     """
-    複数回参照する(間引きできる)ターゲットを検索し，そのターゲットへのエッジをリストにして渡す．
+    エッジの間引きを行う。
+    各ノードのターゲットから、間引いてよいターゲットを見つけ、間引く。
+    間引いてよいターゲットとは、他のターゲットを経由しても辿り着けるターゲットである。
+    ノードをターゲットが先になる順(トポロジカル順)に処理し、各ノードの全祖先を
+    ノードIDのビット集合(int)で表すので、再帰は行わず、集合のコピーも作らない。
     Args:
-        node: 間引きたいノード(ソース側)。
-        node2ancestors: key=nodeのtarget, value=keyの全祖先のノードのセット の辞書。
+        nodes: 間引きを行いたいノード(1個以上)
     Return:
-        waste_edges: 間引いてよいエッジ(source, target)のリスト。
-                            source,targetはともにNodeオブジェクト。
     """
-    waste_edges = list()
-    ancestors_more_than_2_gen_ago = set()
-    for target in node.targets:
-        ancestors_more_than_2_gen_ago = ancestors_more_than_2_gen_ago | node2ancestors[target]
-    waste_targets = ancestors_more_than_2_gen_ago.intersection(node.targets)
-    for target in waste_targets:
-        waste_edges.append((node, target))
-    return waste_edges
-
+    sorted_nodes = sort_nodes_topologically(nodes)
+    node2id = {node: i for i, node in enumerate(sorted_nodes)}
+    ancestors = [0] * len(sorted_nodes)  # ancestors[i]: ノードiの全祖先のビット集合
+    # まだ処理していないソースの数。0になったノードの祖先はもう参照されないので捨てる
+    pending_sources = [len(node.sources) for node in sorted_nodes]
+    for i, node in enumerate(sorted_nodes):
+        direct = 0  # ターゲットのビット集合
+        indirect = 0  # ターゲットを経由して辿り着ける祖先のビット集合
+        for target in node.targets:
+            j = node2id[target]
+            direct |= 1 << j
+            indirect |= ancestors[j]
+            pending_sources[j] -= 1
+            if pending_sources[j] == 0:
+                ancestors[j] = 0
+        ancestors[i] = direct | indirect
+        if direct & indirect:
+            waste_targets = [t for t in node.targets if indirect >> node2id[t] & 1]
+            for target in waste_targets:
+                node.targets.remove(target)
+                target.sources.remove(node)
+
+
+def sort_nodes_topologically(nodes):
+    """
+    nodesと、そこからターゲットを辿って到達できる全ノードを、
+    どのノードもそのターゲットより後になるように並べる。
+    深さ優先探索を再帰を使わずに行うので、依存関係が深くても再帰の上限に達しない。
+    Args:
+        nodes: 並べたいノード
+    Return:
+        並べたノードのリスト
+    Raises:
+        ValueError: ターゲットを辿ると自分自身に戻るノードがある場合
+    """
+    sorted_nodes = list()
+    finished = set()
+    on_path = set()
+    for root in nodes:
+        if root in finished:
+            continue
+        on_path.add(root)
+        stack = [(root, iter(root.targets))]
+        while stack:
+            node, targets = stack[-1]
+            for target in targets:
+                if target in finished:
+                    continue
+                if target in on_path:
+                    raise ValueError("cycle detected at " + target.name)
+                on_path.add(target)
+                stack.append((target, iter(target.targets)))
+                break
+            else:
+                # ターゲットを全て並べ終えたので、このノードを並べる
+                stack.pop()
+                on_path.remove(node)
+                finished.add(node)
+                sorted_nodes.append(node)
+    return sorted_nodes
 
 
 """
@@ -208,27 +272,42 @@ def search_waste_edges(node, node2ancestors):
 
 def assign_level(nodes):
     """
-    ノードに階層を割り当てる．
+    ノードに階層を割り当てる(最長パス法)．
+    ルート(collect_top_nodes()を参照)の階層を0とし、それ以外のノードの階層は
+    ターゲットの階層の最大値+1とする。割り当てたノードのx座標は0にする。
+    ターゲットの階層が全て決まったノードから順に決めていく(Kahnの方法)ので、
+    各ノード・各エッジを1回ずつしか見ない。
+    エッジを持たないノードには階層を割り当てない(x, yは-1のまま)。
     Args:
         nodes: 全ノードをNodeクラスでまとめたリスト。
+    Raises:
+        ValueError: 階層を割り当てられないノードがある場合(ターゲットを辿ると自分自身に戻る場合)
     """
     top_nodes = collect_top_nodes(nodes)
+    remaining_targets = {node: len(node.targets) for node in nodes}  # 階層がまだ決まっていないターゲットの数
     for top_node in top_nodes:
         top_node.x = 0
         top_node.y = 0
-    sorted_nodes = sort_nodes_by_bfs(nodes, top_nodes)
-    assign_level2node(sorted_nodes) 
-    non_assigned_nodes = [n for n in sorted_nodes if n.x < 0]
-    while non_assigned_nodes:
-        print(len(non_assigned_nodes))
-        assign_level2node(non_assigned_nodes)
-        non_assigned_nodes = [n for n in non_assigned_nodes if n.x < 0]
+    queue = deque(top_nodes)
+    while queue:
+        node = queue.popleft()
+        for source in node.sources:
+            remaining_targets[source] -= 1
+            if remaining_targets[source] == 0:
+                source.y = max(t.y for t in source.targets) + 1
+                source.x = 0
+                queue.append(source)
+
+    non_assigned_nodes = [n for n in nodes if n.x < 0 and (n.targets or n.sources)]
+    if non_assigned_nodes:
+        raise ValueError(f"{len(non_assigned_nodes)} nodes cannot be assigned a level "
+                         f"(e.g. {non_assigned_nodes[0].name}); the graph has a cycle")
 
 
 def collect_top_nodes(nodes):
     """
     グラフのルートを決定する。ルート：矢印が出ていない(参照をしていない)ノードである。
-　　その後、level2node()でその下の階層のノードを決めていく。
+　　その後、assign_level()でその下の階層のノードを決めていく。
     Args:
         nodes:全ノードをNodeクラスでまとめたリスト。
     Return:
@@ -240,44 +319,6 @@ def collect_top_nodes(nodes):
     return top_nodes
 
 
-def assign_level2node(sorted_nodes):
-    """
-    sort_nodes_by_bfsで並び替えられたノードに階層を割り当てる．
-    Args:
-        sorted_nodes: sort_nodes_by_bfsで並び替えられたノード．
-    """
-    for node in sorted_nodes:
-        if node.x < 0:
-            if any([a.x < 0 for a in node.targets]):
-                continue
-            lowest_level  = max(t.y for t in node.targets)
-            node.y = lowest_level + 1
-            node.x = 0
-
-            
-def sort_nodes_by_bfs(nodes, top_nodes):
-    """
-    グラフを幅優先探索し，階層を割り当てる順に並べる．
-    Args:
-        nodes: 全ノードをNodeクラスでまとめたリスト。
-        top_nodes: nodes内のtargetsを持たないノード．
-    """
-    sorted_nodes = list()
-    queue = list()
-    sorted_nodes.extend(top_nodes)
-    queue.extend(top_nodes)
-    visited_nodes = set(top_nodes)
-    
-    while queue:
-        n = queue.pop(0)
-        for s in n.sources:
-            if not s in visited_nodes:
-                sorted_nodes.append(s)
-                visited_nodes.add(s)
-                queue.append(s)
-    return sorted_nodes
-    
-            
 def assign_x_sequentially(nodes):
     """
     全てのノードに対して、x座標を割り当てる。
@@ -370,23 +411,149 @@ def cut_edge(source, target):
     return dummy
 
 
-def sort_nodes_by_xcenter(all_nodes, downward):
+def reduce_crossings(all_nodes, max_iterations=24, median=False, tracer=NULL_TRACER, vectorized=False):
+    """
+    sort_nodes_by_xcenter()を上から下へ、下から上へと交互に繰り返し、交差数を減らす。
+    繰り返し方はminimize_crossings()を参照。
+    Args:
+        all_nodes: 全ノードをNodeオブジェクトでまとめたリスト。x座標は割り当て済みであること。
+        max_iterations: 上下の走査を往復する回数の上限
+        median: Trueなら重心の代わりに中央値で並べる。calc_xmedian()を参照。
+        tracer: 各走査と交差数を記録するStageTracer
+        vectorized: Trueならlayer_sweep.LayerSweeperを使い、走査と交差数の計測をNumPyの配列で行う。
+                    結果は同じになる。numpyが必要。
+    Return:
+        最終的な交差数(int)
+    """
+    if vectorized:
+        from layer_sweep import LayerSweeper
+        with tracer.span("LayerSweeper"):
+            sweeper = LayerSweeper(all_nodes)
+    else:
+        sweeper = NodeListSweeper(all_nodes)
+    return minimize_crossings(sweeper, max_iterations, median, tracer)
+
+
+class NodeListSweeper:
+    """
+    Nodeオブジェクトのリストに対してminimize_crossings()を行うためのクラス。
+    layer_sweep.LayerSweeper, layered_graph.LayeredGraphと同じメソッドを持つ。
+
+    Attributes:
+        nodes: 全ノードをNodeオブジェクトでまとめたリスト。
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+
+    def sort_by_xcenter(self, downward, median=False):
+        sort_nodes_by_xcenter(self.nodes, downward, median)
+
+    def count_cross(self):
+        return count_cross(self.nodes)
+
+    def get_x(self):
+        return [node.x for node in self.nodes]
+
+    def set_x(self, xs):
+        for node, x in zip(self.nodes, xs):
+            node.x = x
+
+    def write_back(self):
+        pass
+
+
+class LayerSubsetSweeper:
+    """
+    layered_graph.LayeredGraph(またはlayer_sweep.LayerSweeper)の一部の階層だけを並べ替えるためのクラス。
+    交差数は、並べ替える階層に接するエッジの間だけで数える(他の交差は並べ替えで変わらない)。
+    NodeListSweeperと同じメソッドを持つ。
+
+    Attributes:
+        sweeper: layered_graph.LayeredGraphか、LayerSweeper.from_layered_graph()で作ったlayer_sweep.LayerSweeper
+        levels: 並べ替える階層の集合
+    """
+
+    def __init__(self, sweeper, levels):
+        self.sweeper = sweeper
+        self.levels = levels
+
+    def sort_by_xcenter(self, downward, median=False):
+        self.sweeper.sort_by_xcenter(downward, median, self.levels)
+
+    def count_cross(self):
+        return self.sweeper.count_cross(self.levels)
+
+    def get_x(self):
+        return self.sweeper.get_x()
+
+    def set_x(self, xs):
+        self.sweeper.set_x(xs)
+
+    def write_back(self):
+        self.sweeper.write_back()
+
+
+def minimize_crossings(sweeper, max_iterations=24, median=False, tracer=NULL_TRACER):
+    """
+    重心(中央値)による並べ替えを上から下へ、下から上へと交互に繰り返し、交差数を減らす。
+    各走査の後に交差数を数え、最も交差数が少なかった並びを覚えておく。
+    上下1往復で交差数が減らなくなるか、max_iterations往復に達したら終了し、
+    最も交差数が少なかった並び(x座標)に戻す。
+    Args:
+        sweeper: sort_by_xcenter(downward, median), count_cross(), get_x(), set_x(x), write_back()を持つもの。
+                 NodeListSweeper, layer_sweep.LayerSweeper, layered_graph.LayeredGraphのいずれか。
+        max_iterations: 上下の走査を往復する回数の上限
+        median: Trueなら重心の代わりに中央値で並べる。
+        tracer: 各走査と交差数を記録するStageTracer
+    Return:
+        最終的な交差数(int)
+    """
+    best_cross = sweeper.count_cross()
+    best_x = sweeper.get_x()
+    tracer.set_counter("crossings_initial", best_cross)
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        improved = False
+        for downward in (True, False):
+            with tracer.span("sort_nodes_by_xcenter", downward=downward, iteration=iteration):
+                sweeper.sort_by_xcenter(downward, median)
+            with tracer.span("count_cross"):
+                cross = sweeper.count_cross()
+            if cross < best_cross:
+                best_cross = cross
+                best_x = sweeper.get_x()
+                improved = True
+        if not improved:
+            break
+
+    sweeper.set_x(best_x)
+    sweeper.write_back()
+    tracer.set_counter("crossings", best_cross)
+    tracer.set_counter("crossing_iterations", iteration)
+    return best_cross
+
+
+def sort_nodes_by_xcenter(all_nodes, downward, median=False):
     """
     重心が小さいノードから左に配置する。
     重心の計算はcalc_xcenter()にて説明。
     上の階層から下の階層へ、もしくは下の階層から上の階層へと操作を行う。
+    上から下へ操作する場合は、1つ上の階層にあるターゲットから重心を求め、
+    下から上へ操作する場合は、1つ下の階層にあるソースから重心を求める。
     Args:
         all_nodes:全ノードをNodeオブジェクトでまとめたリスト。
         downward: Trueなら階層の上から下へ操作を行う。Falseなら階層の下から上へと操作を行う。
+        median: Trueなら重心の代わりに中央値(calc_xmedian())を使う。
     Return:
     """
     level2nodes = divide_nodes_by_level(all_nodes)
     if downward:
         for level, nodes in sorted(level2nodes.items()):  # levelでループ
-            assign_x_by_xcenter(node2xcenter(nodes, from_targets=False))
+            assign_x_by_xcenter(node2xcenter(nodes, from_targets=True, median=median))
     else:
         for level, nodes in sorted(level2nodes.items(), key=lambda k: -k[0]):
-            assign_x_by_xcenter(node2xcenter(nodes, from_targets=False))
+            assign_x_by_xcenter(node2xcenter(nodes, from_targets=False, median=median))
 
 
 def divide_nodes_by_level(nodes):
@@ -403,22 +570,24 @@ def divide_nodes_by_level(nodes):
     return each_level_nodes
 
 
-def node2xcenter(nodes, from_targets):
+def node2xcenter(nodes, from_targets, median=False):
     """
     (v1, v2)のタプルのリストを作る。
         v1=Nodeオブジェクト、v2=v1の重心の値(float)
     Args:
         nodes:重心を求めたいNodeオブジェクトのリスト。Nodeオブジェクトの階層は等しいのが好ましい。
         from_targets: True:重心をtargetsを用いて計算する, False:重心をsourcesを用いて計算する。
+        median: Trueなら重心の代わりに中央値(calc_xmedian())を求める。
     Return:
          (v1, v2)となるタプルのリスト。
             v1: Nodeオブジェクト
             v2: 重心の値(float)
     """
+    calc = calc_xmedian if median else calc_xcenter
     if from_targets:
-        return [(node, calc_xcenter(node.targets)) for node in nodes]
+        return [(node, calc(node.targets)) for node in nodes]
     else:
-        return [(node, calc_xcenter(node.sources)) for node in nodes]
+        return [(node, calc(node.sources)) for node in nodes]
 
 
 def calc_xcenter(nodes):
@@ -440,16 +609,37 @@ def calc_xcenter(nodes):
         return float('infinity')
 
 
+def calc_xmedian(nodes):
+    """
+    nodeの位置をターゲットもしくはソースのx座標の中央値として求める。
+    個数が偶数の場合は中央の2つの平均値とする。
+    ターゲット(もしくはソース)が存在しない場合は正の無限大, float('infinity')
+    Args:
+        nodes: ターゲットもしくはソースの集合。
+    Return:
+        中央値(float)
+    """
+    if len(nodes) == 0:
+        return float('infinity')
+    xs = sorted(node.x for node in nodes)
+    middle = len(xs) // 2
+    if len(xs) % 2:
+        return float(xs[middle])
+    return (xs[middle - 1] + xs[middle]) / 2
+
+
 def assign_x_by_xcenter(node2xcenter_tuple):
     """
     タプル(v1, v2)のリストをソートし、それらに順にx座標を割り当てる。
+    重心の値が等しいノードは今のx座標の順を保つ。
         v1: Nodeオブジェクト
         v2: v1の重心の値(float)
     Args:
         node2xcenter_tuple: (v1, v2) のタプルのリスト(v1, v2は同上)
     Return:
     """
-    sorted_node2xcenter = sorted(node2xcenter_tuple, key=lambda tup: tup[1])  # 重心の値で昇順にソート
+    # 重心の値で昇順にソート
+    sorted_node2xcenter = sorted(node2xcenter_tuple, key=lambda tup: (tup[1], tup[0].x))
     sorted_nodes = [node[0] for node in sorted_node2xcenter]
     assign_x_sequentially(sorted_nodes)
 
@@ -465,9 +655,12 @@ def count_cross(all_nodes):
     交差数を階層ごとに上から下へと数える。
     交差条件
         2つのエッジedge=(s1, t1), other_edge=(s2, t2)において
+        ・t1とt2のy座標が等しい
         ・s1とs2のy座標が等しい
         ・s1のx座標がs2のx座標より小さい
         ・t1のx座標がt2のx座標より大きい
+    エッジをターゲットとソースの階層の組ごとに分け、count_inversions()で数えるので、
+    全てのエッジの組を比べる必要はない(1階層あたりO(E log E))。
     Args:
         all_nodes:全てのノード。Nodeオブジェクトのリスト。
     Return:
@@ -476,12 +669,12 @@ def count_cross(all_nodes):
     cross_counter = 0
     level2nodes = divide_nodes_by_level(all_nodes)
     for level, nodes in sorted(level2nodes.items()):
-        edges = make_edge(nodes)
-        for edge in edges:
-            for other_edge in edges:
-                # edge[0]: sourceノード, エッジのソース.  edge[1]: targetノード, エッジのターゲット.
-                if edge[0].y == other_edge[0].y and edge[0].x < other_edge[0].x and edge[1].x > other_edge[1].x:
-                    cross_counter += 1
+        source_level2edges = defaultdict(list)
+        for node in nodes:
+            for source in node.sources:
+                source_level2edges[source.y].append((source.x, node.x))
+        for edges in source_level2edges.values():
+            cross_counter += count_inversions(edges)
     return cross_counter
 
 
@@ -502,6 +695,17 @@ def make_edge(nodes):
     return edges
 
 
+def count_edges(all_nodes):
+    """
+    エッジの数を返す。
+    Args:
+        all_nodes: 全てのノード。Nodeオブジェクトのリスト。
+    Return:
+        エッジの数(int)
+    """
+    return sum(len(node.targets) for node in all_nodes)
+
+
 def calc_edge_length_sum(all_nodes):
     """
     エッジの長さの総和を返す。
@@ -577,8 +781,7 @@ def move_node_closer_to_connected_nodes(all_nodes, downward):
     ノードのx座標をターゲットもしくはソースに近づくように更新する。
     更新は上の階層から下の階層へ、もしくは下の階層から上の階層へと各階層ごとに行う。
     更新のために、優先順位や理想x座標を求め、更新は
-    update_x_in_priority_order(), update_x2idealx_recursively()
-    にて行う。
+    update_x_in_priority_order()にて行う。1つの階層の更新はほぼ線形時間で済む。
     Args:
         all_nodes: 全てのノード
         downward: 上の階層から下の階層へ行うかどうか。
@@ -682,85 +885,223 @@ def update_x_in_priority_order(nodes, node2priority_dict, node2idealx_dict):
     """
     1つの階層のノードのx座標の更新順序を決め、更新を行う。
     順序は優先度(priority)が大きい順とする。優先度が同じ場合は、x座標の値が小さいほうが先になる。
-    更新は、update_x2idealx_recursively()にて行う。
+    更新は、layered_graph.place_at_idealx()にて行う。
     アルゴリズム
         1．与えられたnodesをx座標値で昇順にソートする
-        2．ノードのx座標値を優先度が高い順に更新していく。
-        3．更新したノードはその都度記録する。
+        2．ノードのx座標値を優先度が高い順に理想x座標へ近づける。途中にあるノードは間を詰めて押していく。
+        3．更新したノードは、以降のノードの更新で押さないようにする。
     Args:
         nodes: 同階層のノードのリスト
         node2priority_dict: key=Nodeオブジェクト, value=優先度 となっている辞書
         node2idealx_dict: key=Nodeオブジェクト, value=理想のx座標値 となっている辞書
     Return:
     """
-    assigned_nodes = []
     nodes = sorted(nodes, key=lambda a: a.x)
-    for node, priority in sorted(node2priority_dict.items(), key=lambda a: (-a[1], a[0].x)):
-        node_stack = Stack()
-        node_stack.push(node)
-        sign = 1 if node.x < node2idealx_dict[node] else -1
-        update_x2idealx_recursively(nodes.index(node), nodes, node2idealx_dict[node], node_stack, assigned_nodes, sign)
-        assigned_nodes.append(node)
+    xs = place_at_idealx([node.x for node in nodes],
+                         [node2idealx_dict[node] for node in nodes],
+                         [node2priority_dict[node] for node in nodes])
+    for node, x in zip(nodes, xs):
+        node.x = x
+
 
-        
-def update_x2idealx_recursively(node_index, same_level_nodes, ideal_x,  node_stack, assigned_nodes, sign):
+def assign_coordinates(all_nodes, tracer=NULL_TRACER):
     """
-    ノードのx座標を更新する。
-    アルゴリズム
-        1. 更新するノード(same_level_nodes[node_index])が、ノード列の端に到達していた場合、
-           node_stackに入ったノードを理想x座標まで動かし、割り当てて、走査終了
-        2. node_indexの隣のインデックスのノードを取得する
-        3. 2で取得したノードのx座標が理想x座標よりも遠い場所にあった場合
-            node_stackを理想x座標まで動かし、割り当てて、走査終了
-        4. 2で取得したノードのx座標が理想x座標よりも近い、あるいは一致していた場合
-            4.1 そのノードが割当済みノードならば、その1つ手前のx座標からnode_stack内のノードを並べる
-            4.2 そのノードが割当済みでなければ、node_stackにそのノードを追加、更新するノードをそのノードにし、
-                理想x座標を更新し、1に戻る。
-    Args:
-        node_index: x座標を更新したいノードのsame_level_nodesにおけるインデックス
-        same_level_nodes: 操作を行う階層のノード
-        ideal_x: x座標を更新したいノードsame_level_nodes[node_index]の理想のx座標値
-        assigned_nodes: 既に割り当てを行った、動かしたくないノードのリスト
-        node_stack: 座標を更新している途中のノードが入ったスタック。
-                    初期値としてsame_level_nodes[node_index]をプッシュしておく必要がある。
-        sign: 理想x座標が今のx座標より大きいければ+1, 小さければ-1。
-    Return:
-    """
-    if (node_index == 0 and sign == -1) or (node_index == len(same_level_nodes) - 1 and sign == 1):
-        assign_x_in_sequence(node_stack, ideal_x, -sign)
-        return
-
-    next_node = same_level_nodes[node_index+sign]
-
-    if (next_node.x > ideal_x and sign == 1) or (next_node.x < ideal_x and sign == -1):
-        assign_x_in_sequence(node_stack, ideal_x, -sign)
-        return
+    交差削減の後、move_node_closer_to_connected_nodes()を上から下へ、下から上へと1回ずつ行い、
+    各ノードをターゲット・ソースに近づける。
+    Args:
+        all_nodes: 全ノードをNodeオブジェクトでまとめたリスト
+        tracer: 各走査を記録するStageTracer
+    Return:
+    """
+    for downward in (True, False):
+        with tracer.span("move_node_closer_to_connected_nodes", downward=downward):
+            move_node_closer_to_connected_nodes(all_nodes, downward)
+    tracer.set_counter("edge_length_sum", calc_edge_length_sum(all_nodes))
+
 
+def layout_layered_graph(store, max_iterations=24, median=False, tracer=NULL_TRACER, vectorized=False,
+                         coordinates=False):
+    """
+    階層割り当て済みのNodeStoreから、長いエッジを区間の配列としたLayeredGraphを作り、交差削減を行う。
+    ダミーノード(Nodeオブジェクト)を作らないので、メモリは長いエッジの区間1つあたり数個の整数で済む。
+    Args:
+        store: 間引きと階層割り当てを行ったnode_store.NodeStore
+        max_iterations, median, tracer: minimize_crossings()を参照。
+        vectorized: Trueならlayer_sweep.LayerSweeperで交差削減を行う(numpyが必要)。
+        coordinates: Trueなら交差削減の後に座標決定(assign_coordinates()と同じもの)を行う。
+    Return:
+        x座標を決めたlayered_graph.LayeredGraph
+    """
+    with tracer.span("LayeredGraph"):
+        layered_graph = LayeredGraph(store)
+    tracer.set_counter("levels", len(layered_graph.layers))
+    tracer.set_counter("long_edges", len(layered_graph.long_edge_sources))
+    tracer.set_counter("virtual_segments", layered_graph.segment_count)
+
+    if vectorized:
+        from layer_sweep import LayerSweeper
+        with tracer.span("LayerSweeper"):
+            sweeper = LayerSweeper.from_layered_graph(layered_graph)
     else:
-        if next_node in assigned_nodes:
-            assign_x_in_sequence(node_stack, next_node.x-sign, -sign)
-        else:
-            node_stack.push(next_node)
-            node_index += sign
-            ideal_x += sign
-            update_x2idealx_recursively(node_index, same_level_nodes, ideal_x, node_stack, assigned_nodes, sign)
-            
-            
-def assign_x_in_sequence(nodes_stack, x, sign):
+        sweeper = layered_graph
+    with tracer.span("reduce_crossings"):
+        minimize_crossings(sweeper, max_iterations, median, tracer)
+    if coordinates:
+        for downward in (True, False):
+            with tracer.span("move_node_closer_to_connected_nodes", downward=downward):
+                layered_graph.move_closer_to_connected_members(downward)
+    return layered_graph
+
+
+
+def layout_incrementally(store, previous, max_iterations=24, median=False, tracer=NULL_TRACER, vectorized=False,
+                         coordinates=False):
+    """
+    以前の配置を初期値として、変更のあった部分だけを配置し直す。
+        1. 以前の配置と比べて、追加・削除されたノードとエッジを求める。
+        2. 階層は、追加されたノードと、追加・削除されたエッジの両端から辿れる範囲だけ割り当て直す
+           (node_store.NodeStore.update_level())。
+        3. 階層が変わったノード、追加・削除されたノード・エッジがある階層(長いエッジが通る階層を含む)を
+           変更のあった階層とする。
+        4. 全てのメンバに以前のx座標を入れ(layered_graph.LayeredGraph.seed_x())、
+           交差削減と座標決定は変更のあった階層だけで行う。他の階層は以前の配置のままになる。
+    Args:
+        store: 間引きを行ったnode_store.NodeStore。階層割り当ては行っていないこと。
+        previous: load_previous_layout()の戻り値
+        max_iterations, median, tracer: minimize_crossings()を参照。
+        vectorized: Trueならlayer_sweep.LayerSweeperで交差削減を行う(numpyが必要)。
+        coordinates: Trueなら変更のあった階層で座標決定を行う。
+    Return:
+        x座標を決めたlayered_graph.LayeredGraph
+    """
+    name2xy, edge2bends = previous
+    names = store.names
+    for i, name in enumerate(names):
+        store.y[i] = name2xy[name][1] if name in name2xy else -1
+
+    edges = {(names[s], names[t]) for s, t in store.iter_edges()}
+    changed_edges = (edges - edge2bends.keys()) | (edge2bends.keys() - edges)
+    added_nodes = [i for i, name in enumerate(names) if name not in name2xy]
+    removed_names = name2xy.keys() - store.name2id.keys()
+    dirty = set(added_nodes)
+    dirty.update(store.name2id[name] for edge in changed_edges for name in edge if name in store.name2id)
+    with tracer.span("update_level"):
+        changed = store.update_level(dirty)
+    tracer.set_counter("changed_edges", len(changed_edges))
+    tracer.set_counter("relayered_nodes", len(changed))
+
+    def levels_of(name):
+        """nameの以前と今の階層"""
+        levels = [name2xy[name][1]] if name in name2xy else []
+        if name in store.name2id:
+            levels.append(store.y[store.name2id[name]])
+        return levels
+
+    touched = set()
+    for name in removed_names:
+        touched.update(levels_of(name))
+    for i in changed.union(added_nodes):
+        touched.update(levels_of(names[i]))
+        changed_edges.update((names[i], names[t]) for t in store.targets(i))
+        changed_edges.update((names[s], names[i]) for s in store.sources(i))
+    for source, target in changed_edges:
+        levels = levels_of(source) + levels_of(target)
+        if levels:
+            touched.update(range(min(levels), max(levels) + 1))
+
+    with tracer.span("LayeredGraph"):
+        layered_graph = LayeredGraph(store)
+        levels = layered_graph.seed_x({name: xy[0] for name, xy in name2xy.items()}, edge2bends, touched)
+    tracer.set_counter("levels", len(layered_graph.layers))
+    tracer.set_counter("touched_levels", len(levels))
+    if vectorized:
+        from layer_sweep import LayerSweeper
+        with tracer.span("LayerSweeper"):
+            sweeper = LayerSweeper.from_layered_graph(layered_graph)
+    else:
+        sweeper = layered_graph
+    with tracer.span("reduce_crossings"):
+        minimize_crossings(LayerSubsetSweeper(sweeper, levels), max_iterations, median, tracer)
+    if coordinates:
+        for downward in (True, False):
+            with tracer.span("move_node_closer_to_connected_nodes", downward=downward):
+                layered_graph.move_closer_to_connected_members(downward, levels)
+    return layered_graph
+
+
+def layout_component(store, max_iterations=24, median=False, vectorized=False, coordinates=False):
     """
-    nodes_stack内のノードを空になるまでポップして、順にx座標を割り当てる。
+    1つの連結成分(NodeStore)の階層割り当て、交差削減、座標決定を行う。プロセスプールのワーカーで実行する。
     Args:
-        nodes_stack: ノードが入ったスタック
-        x: 最初popされるノードに割り当てるx座標の値
-        sign: +1 or -1, +1: 順に増やしたい場合、-1: 順に減らしたい場合
+        store: 間引きを行った連結成分のnode_store.NodeStore
+        max_iterations, median, vectorized, coordinates: layout_layered_graph()を参照。
     Return:
+        x座標を決めたlayered_graph.LayeredGraph。x座標の最小値は0。
     """
-    while nodes_stack.is_empty() is False:
-        node = nodes_stack.pop()
-        node.x = x
-        x += sign
+    store.assign_level()
+    return layout_layered_graph(store, max_iterations, median, vectorized=vectorized, coordinates=coordinates)
 
 
+def layout_components(store, workers=1, max_iterations=24, median=False, vectorized=False, coordinates=False,
+                      tracer=NULL_TRACER):
+    """
+    間引きを行ったNodeStoreを弱連結成分に分け、成分ごとにlayout_component()を行い、横に並べる。
+    エッジを持つ成分は大きい順に左から並べ、成分の間は1つ空ける。
+    エッジを持たないノードは、virtual=Trueでmain()を実行した場合と同じく、まとめて階層-1にx=0から
+    ノードIDの順に1列に並べる(1つのLayeredGraphにする)。
+    workersが2以上の場合は、エッジを持つ成分をプロセスプールで並列に処理する。
+    Args:
+        store: 間引きを行ったnode_store.NodeStore。階層割り当ては行っていないこと。
+        workers: ワーカープロセスの数。1なら逐次処理。
+        max_iterations, median, vectorized, coordinates: layout_layered_graph()を参照。
+        tracer: 分割と配置を記録するStageTracer
+    Return:
+        x座標を決めたlayered_graph.LayeredGraphのリスト。エッジを持つ成分を左から並べた順で、
+        エッジを持たないノードがあればその階層-1の列が最後になる。
+    """
+    with tracer.span("weakly_connected_components"):
+        components = store.weakly_connected_components()
+        # 1つだけのノードからなる成分は、エッジを持たない
+        isolated_ids = array('i', (ids[0] for ids in components if len(ids) == 1))
+        components = sorted((ids for ids in components if len(ids) > 1), key=len, reverse=True)
+        subgraphs = [store.subgraph(ids) for ids in components]
+    tracer.set_counter("components", len(subgraphs))
+    tracer.set_counter("isolated_nodes", len(isolated_ids))
+
+    layout = functools.partial(layout_component, max_iterations=max_iterations, median=median,
+                               vectorized=vectorized, coordinates=coordinates)
+    with tracer.span("layout_component", workers=workers):
+        if workers <= 1:
+            graphs = [layout(sub) for sub in subgraphs]
+        else:
+            chunksize = max(1, len(subgraphs) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                graphs = list(executor.map(layout, subgraphs, chunksize=chunksize))
+
+    with tracer.span("pack_components"):
+        offset = 0
+        for layered_graph in graphs:
+            left, right = min(layered_graph.x), max(layered_graph.x)
+            layered_graph.set_x([x - left + offset for x in layered_graph.x])
+            offset += right - left + 2
+        if isolated_ids:
+            # 階層は割り当てていない(y=-1)ので、LayeredGraphは階層-1の1列になる
+            graphs.append(LayeredGraph(store.subgraph(isolated_ids)))
+    return graphs
+
+
+def merge_cytoscape(layered_graphs):
+    """
+    layout_components()の結果を、1つのcytoscape.jsの記述形式(LayeredGraph.to_cytoscape()と同じ形)にまとめる。
+    """
+    nodes = list()
+    edges = list()
+    for layered_graph in layered_graphs:
+        elements = layered_graph.to_cytoscape()["elements"]
+        nodes.extend(elements["nodes"])
+        edges.extend(elements["edges"])
+    return {"data": [], "directed": True, "multigraph": False, "elements": {"nodes": nodes, "edges": edges}}
+
 """
 仕上げ
 """
@@ -807,12 +1148,37 @@ def create_dependency_graph(node_list, graph):
             graph.add_edge(source.name, target.name)
 
 
-def main():
+def main(input_path=None, trace_path=None, max_iterations=24, median=False, vectorized=False, compact=False,
+         virtual=False, coordinates=False, workers=None, previous_path=None):
     """
     関数の実行を行う関数。
 
+    Args:
+        input_path: parse_reference.pyの出力ファイル(nodes1.json, nodes1.ndjson, nodes1.csr, nodes1.sqlite等)のパス。
+                    Noneの場合はデモ用の小さなグラフを使う。
+        trace_path: 段階ごとの実行時間・ピークメモリと、エッジ数・ダミーノード数・交差数を
+                    JSONで書き出すパス。Noneなら計測しない。計測した場合は集計結果も表示する。
+        max_iterations: 交差削減で上下の走査を往復する回数の上限。reduce_crossings()を参照。
+        median: Trueなら交差削減で重心の代わりに中央値を使う。
+        vectorized: Trueなら交差削減をNumPyの配列で行う(numpyが必要)。
+        compact: Trueなら間引きと階層割り当てをnode_store.NodeStoreの配列で行う。
+        virtual: Trueならcompactに加えて、ダミーノードを作らずにlayered_graph.LayeredGraphで交差削減を行う。
+                 長いエッジは1本のエッジとして出力し、途中の座標を"bends"に入れる(layout_layered_graph()を参照)。
+        coordinates: Trueなら交差削減の後に座標決定を行い、ノードをターゲット・ソースに近づける(assign_coordinates()を参照)。
+        workers: Noneでなければ、virtualに加えて、グラフを弱連結成分に分けてworkers個のワーカープロセスで
+                 並列に配置し、横に並べる(layout_components()を参照)。エッジを持たないノードは、
+                 virtualと同じく階層-1に1列に並べる。
+        previous_path: Noneでなければ、virtualに加えて、このパスにある以前の出力(demo_sample.json)を初期値とし、
+                       変更のあった階層だけを配置し直す(layout_incrementally()を参照)。
+                       workersとは同時に指定できない(成分ごとの配置は以前の配置を初期値にしない)。
+
+    Raises:
+        ValueError: previous_pathとworkersを両方指定した場合
+
     Return:
     """
+    if previous_path is not None and workers is not None:
+        raise ValueError("previous_path cannot be combined with workers")
     import random
 
     def shuffle_dict(d):
@@ -855,19 +1221,88 @@ def main():
                        "q": [{"k", "o", "i"}, "example.html"],
                        }
 
-    node_list = create_node_list(shuffle_dict(input_node_dict))
+    tracer = NULL_TRACER if trace_path is None else StageTracer()
+
+    input_nodes = shuffle_dict(input_node_dict) if input_path is None else load_input_nodes(input_path)
+    layered_graphs = None  # LayeredGraphで配置した場合、左から並べた順のリスト
+    if compact or virtual or workers is not None or previous_path is not None:
+        # 間引きと階層割り当てはノードを配列で持ったまま行う
+        with tracer.span("NodeStore.from_input_nodes"):
+            store = NodeStore.from_input_nodes(input_nodes)
+        tracer.set_counter("nodes", len(store))
+        tracer.set_counter("edges", store.edge_count)
+        with tracer.span("remove_waste_edges"):
+            store.remove_waste_edges()
+        tracer.set_counter("edges_after_remove_waste_edges", store.edge_count)
+        if previous_path is not None:
+            # 階層割り当て以降は、以前の配置から変更のあった部分だけ行う
+            with tracer.span("load_previous_layout"):
+                previous = load_previous_layout(previous_path)
+            layered_graphs = [layout_incrementally(store, previous, max_iterations, median, tracer, vectorized,
+                                                   coordinates)]
+        elif workers is not None:
+            # 階層割り当て以降は成分ごとに行う
+            layered_graphs = layout_components(store, workers, max_iterations, median, vectorized, coordinates,
+                                               tracer)
+        else:
+            with tracer.span("assign_level"):
+                store.assign_level()
+            if virtual:
+                # ダミーノードを作らず、長いエッジの区間のまま交差削減を行う
+                layered_graphs = [layout_layered_graph(store, max_iterations, median, tracer, vectorized,
+                                                       coordinates)]
+            else:
+                with tracer.span("NodeStore.to_node_list"):
+                    node_list = store.to_node_list(Node)
+        del store
+    else:
+        with tracer.span("create_node_list"):
+            node_list = create_node_list(input_nodes)
+        tracer.set_counter("nodes", len(node_list))
+        tracer.set_counter("edges", count_edges(node_list))
+
+        # 間引き
+        with tracer.span("remove_waste_edges"):
+            remove_waste_edges(node_list)
+        tracer.set_counter("edges_after_remove_waste_edges", count_edges(node_list))
+
+        # 階層割り当て
+        with tracer.span("assign_level"):
+            assign_level(node_list)
+
+    if layered_graphs is None:
+        tracer.set_counter("levels", len({node.y for node in node_list}))
+
+        dummy_count = cut_edge.count
+        with tracer.span("cut_edges_higher_than_1"):
+            cut_edges_higher_than_1(node_list)
+        tracer.set_counter("dummy_nodes", cut_edge.count - dummy_count)
+        tracer.set_counter("edges_after_cut_edges", count_edges(node_list))
+
+        with tracer.span("assign_x_sequentially"):
+            assign_x_sequentially(node_list)
+        with tracer.span("reduce_crossings"):
+            reduce_crossings(node_list, max_iterations, median, tracer, vectorized)
+        if coordinates:
+            with tracer.span("assign_coordinates"):
+                assign_coordinates(node_list, tracer)
+
+    with tracer.span("export"):
+        if layered_graphs is None:
+            graph_json = node_list2cytoscape(node_list)
+        else:
+            graph_json = merge_cytoscape(layered_graphs)
+    export_graph_json(graph_json, tracer, trace_path)
 
-    # 間引き
-    remove_waste_edges(node_list)
-    
-    # 階層割り当て
-    assign_level(node_list)
-    
-    cut_edges_higher_than_1(node_list)
-    assign_x_sequentially(node_list)
-    sort_nodes_by_xcenter(node_list, downward=True)
-    sort_nodes_by_xcenter(node_list, downward=False)
 
+def node_list2cytoscape(node_list):
+    """
+    Nodeオブジェクトのリストから有向グラフを作り、cytoscape.jsの記述形式に変換する。
+    Args:
+        node_list: 座標を決めたNodeオブジェクトのリスト
+    Return:
+        cytoscape.jsの記述形式(networkx.cytoscape_data()の出力)
+    """
     node_attributes = node_list2node_dict(node_list)
 
     # 有向グラフGraphの作成
@@ -882,11 +1317,56 @@ def main():
     nx.draw_networkx(graph)
 
     # cytoscape.jsの記述形式(JSON)でグラフを記述
-    graph_json = nx.cytoscape_data(graph, attrs=None)
+    return nx.cytoscape_data(graph, attrs=None)
+
+
+def export_graph_json(graph_json, tracer, trace_path):
+    """
+    cytoscape.jsの記述形式のグラフをdemo_sample.jsonに書き出し、finish_trace()で計測を終える。
+    """
+    with tracer.span("write_json"):
+        with open('demo_sample.json', 'w') as f:
+            f.write(json.dumps(graph_json))
+    finish_trace(tracer, trace_path)
+
 
-    with open('demo_sample.json', 'w') as f:
-        f.write(json.dumps(graph_json))
+def finish_trace(tracer, trace_path):
+    """
+    計測を終了し、結果をtrace_pathに書き出して集計結果を表示する。trace_pathがNoneなら何もしない。
+    """
+    if trace_path is not None:
+        tracer.close()
+        tracer.write_json(trace_path)
+        print(tracer.summary())
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="依存関係を階層形式で表示する")
+    parser.add_argument("input", nargs="?", default=None,
+                        help="parse_reference.pyの出力ファイル(.json, .ndjson, .csr, .sqlite)。省略時はデモ用のグラフ")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="段階ごとの実行時間とピークメモリ、エッジ数・ダミーノード数・交差数をJSONでPATHに書き出す")
+    parser.add_argument("--max-iterations", type=int, default=24,
+                        help="交差削減で上下の走査を往復する回数の上限。交差数が減らなくなればそれより前に終わる")
+    parser.add_argument("--median", action="store_true", help="交差削減で重心の代わりに中央値を使う")
+    parser.add_argument("--numpy", action="store_true",
+                        help="交差削減の走査と交差数の計測をNumPyの配列で行う(結果は同じ。numpyが必要)")
+    parser.add_argument("--compact", action="store_true",
+                        help="間引きと階層割り当てを、Nodeオブジェクトではなく配列で持ったグラフで行う(結果は同じ)")
+    parser.add_argument("--virtual", action="store_true",
+                        help="ダミーノードを作らず、長いエッジを区間の配列として交差削減を行う(--compactを含む)")
+    parser.add_argument("--coordinates", action="store_true",
+                        help="交差削減の後に座標決定を行い、ノードをつながったノードに近づける")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="グラフを弱連結成分に分け、このプロセス数で並列に配置して横に並べる(0ならCPU数。--virtualを含む)")
+    parser.add_argument("--previous", default=None, metavar="PATH",
+                        help="以前の出力(--virtualのdemo_sample.json)を初期値とし、変更のあった階層だけを配置し直す"
+                             "(--virtualを含む)")
+    args = parser.parse_args()
+    if args.previous is not None and args.workers is not None:
+        parser.error("--previous cannot be combined with -j/--workers")
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    main(args.input, args.trace, args.max_iterations, args.median, args.numpy, args.compact, args.virtual,
+         args.coordinates, args.workers, args.previous)
@@ -0,0 +1,136 @@
+"""
+1つのノードの近傍(k世代先までの参照先・k世代前までの参照元)だけを取り出し、その部分グラフを階層化して
+cytoscape.jsの記述形式で返す。全体を配置せずに済むので、1つの定理を開いたときの表示に使う。
+結果は(ノード, k, 向き)ごとに、大きさに上限のあるLRUキャッシュに保持する。
+
+例:
+    python ego_layout.py nodes1.json --port 8000
+    curl "http://localhost:8000/layout?name=XBOOLE_0:def3&k=2&direction=both"
+
+reference_server.pyのエンドポイントに加えて、/layout?name=N&k=k&direction=D に答える。
+directionはancestors(参照先), descendants(参照元), both(両方)のいずれか。省略するとboth。
+"""
+import argparse
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# リポジトリ直下のモジュール(reference_server.py等)を読み込めるようにする
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from reference_server import ReferenceIndex, serve
+from create_graph import layout_component
+from node_store import NodeStore
+
+DIRECTIONS = ("ancestors", "descendants", "both")
+
+
+class EgoLayout:
+    """
+    ReferenceIndexから近傍の部分グラフを取り出して配置する。スレッドから並行に呼び出せる。
+
+    Attributes:
+        index: reference_server.ReferenceIndex
+        cache_size: キャッシュに保持する結果の数の上限
+        max_iterations, coordinates: create_graph.layout_component()を参照。
+        cache: key=(名前, k, 向き), value=cytoscape.jsの記述形式 のOrderedDict。最近使ったものほど後ろ。
+        hits, misses: キャッシュに有った・無かった回数
+    """
+
+    def __init__(self, index, cache_size=256, max_iterations=24, coordinates=True):
+        self.index = index
+        self.cache_size = cache_size
+        self.max_iterations = max_iterations
+        self.coordinates = coordinates
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def layout(self, name, k=1, direction="both"):
+        """
+        nameの近傍を配置した結果を返す。キャッシュに有ればそれを返す。
+        返した辞書はキャッシュと共有しているので、変更しないこと。
+        Args:
+            name: 中心のノードの名前
+            k: 辿る世代数(0以上)
+            direction: "ancestors", "descendants", "both"のいずれか
+        Return:
+            cytoscape.jsの記述形式(layered_graph.LayeredGraph.to_cytoscape()と同じ形)
+        Raises:
+            KeyError: nameのノードがない場合
+            ValueError: kが負、またはdirectionが不正な場合
+        """
+        if k < 0:
+            raise ValueError("k must be non-negative")
+        if direction not in DIRECTIONS:
+            raise ValueError("direction must be one of " + ", ".join(DIRECTIONS))
+        key = (name, k, direction)
+        with self._lock:
+            graph_json = self.cache.get(key)
+            if graph_json is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return graph_json
+            self.misses += 1
+
+        # 配置はロックの外で行う。同じkeyを同時に計算した場合は後の結果で上書きする
+        graph_json = self.compute(name, k, direction)
+        with self._lock:
+            self.cache[key] = graph_json
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return graph_json
+
+    def compute(self, name, k, direction):
+        """キャッシュを使わずに、nameの近傍を取り出して配置する。"""
+        index = self.index
+        ids = self.extract(index.name2id[name], k, direction)
+        id_set = set(ids)
+        input_nodes = [(index.names[i], [[index.names[t] for t in index.targets[i] if t in id_set], index.urls[i]])
+                       for i in ids]
+        store = NodeStore.from_input_nodes(input_nodes)
+        store.remove_waste_edges()
+        layered_graph = layout_component(store, self.max_iterations, coordinates=self.coordinates)
+        return layered_graph.to_cytoscape()
+
+    def extract(self, start, k, direction):
+        """
+        startと、そこからk世代までの参照先・参照元のノードIDを返す。
+        """
+        ids = [start]
+        if direction in ("ancestors", "both"):
+            ids += self.index.traverse(start, self.index.targets, k)
+        if direction in ("descendants", "both"):
+            ids += self.index.traverse(start, self.index.sources, k)
+        # 循環がある場合、参照先と参照元の両方に現れるノードがある
+        return list(dict.fromkeys(ids))
+
+
+def make_routes(ego_layout):
+    """reference_server.serve()に追加するエンドポイントを作る。"""
+
+    def layout_route(params):
+        if "name" not in params:
+            raise ValueError("name is required")
+        k = int(params["k"][0]) if "k" in params else 1
+        direction = params["direction"][0] if "direction" in params else "both"
+        return ego_layout.layout(params["name"][0], k, direction)
+
+    return {"/layout": layout_route}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ノードの近傍だけを配置して返すHTTPサーバ")
+    parser.add_argument("input", help="parse_reference.pyの出力ファイル(.json, .ndjson, .csr, .sqlite)")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=8000, help="待ち受けるポート")
+    parser.add_argument("--cache-size", type=int, default=256, help="キャッシュに保持する配置結果の数")
+    args = parser.parse_args()
+    index = ReferenceIndex.load(args.input)
+    serve(index, args.host, args.port, make_routes(EgoLayout(index, args.cache_size)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+交差削減の走査(create_graph.sort_nodes_by_xcenter())と交差数の計測(create_graph.count_cross())を
+NumPyの配列で行う。
+各階層のノードとその位置を配列で持ち、ターゲット・ソースへの接続を階層ごとにCSR形式で持つので、
+重心の計算や並べ替えはノード1個ずつではなく階層ごとにまとめて行う。
+結果(x座標)はcreate_graph.pyの関数と同じになる。
+
+numpyはこのモジュールでのみ使う。create_graph.reduce_crossings()でvectorized=Trueを指定したときに読み込まれる。
+"""
+import numpy as np
+
+
+class LayerSweeper:
+    """
+    Nodeオブジェクトのリストを配列に変換し、重心(中央値)による並べ替えを行う。
+    ノードは入力のリストでの順番を整数IDとして扱う。
+    from_layered_graph()で、layered_graph.LayeredGraph(長いエッジの区間を含む)から作ることもできる。
+
+    Attributes:
+        nodes: 入力のNodeオブジェクトのリスト。LayeredGraphから作った場合はNone。
+        graph: 入力のLayeredGraph。Nodeオブジェクトのリストから作った場合はNone。
+        x: x[i]はノードiのx座標。np.ndarray(int64)。
+        y: y[i]はノードiの階層。np.ndarray(int64)。
+        layers: 階層の値の昇順のリスト
+        layer2ids: key=階層, value=その階層のノードIDの配列 の辞書
+        layer2targets, layer2sources: key=階層, value=その階層のノードのターゲット(ソース)のCSR の辞書。
+                                      CSRは(indptr, indices, rows)のタプル。layer2ids[階層][k]の
+                                      ターゲットはindices[indptr[k]:indptr[k+1]]、rowsはindicesの各要素のk。
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.graph = None
+        node2id = {node: i for i, node in enumerate(nodes)}
+        self.x = np.fromiter((node.x for node in nodes), dtype=np.int64, count=len(nodes))
+        self.y = np.fromiter((node.y for node in nodes), dtype=np.int64, count=len(nodes))
+        self.layers = np.unique(self.y).tolist()
+        self.layer2ids = dict()
+        self.layer2targets = dict()
+        self.layer2sources = dict()
+        # 同じ階層のノードは入力のリストでの順に並べる(create_graph.divide_nodes_by_level()と同じ)
+        order = np.argsort(self.y, kind="stable")
+        starts = np.searchsorted(self.y[order], self.layers, side="left")
+        ends = np.searchsorted(self.y[order], self.layers, side="right")
+        for level, start, end in zip(self.layers, starts, ends):
+            ids = order[start:end]
+            self.layer2ids[level] = ids
+            self.layer2targets[level] = make_csr([nodes[i].targets for i in ids], node2id)
+            self.layer2sources[level] = make_csr([nodes[i].sources for i in ids], node2id)
+
+    @classmethod
+    def from_layered_graph(cls, graph):
+        """
+        LayeredGraphのメンバ(実在するノードと長いエッジの区間)をノードとして作る。
+        ターゲット・ソースはLayeredGraphのup, downとする。
+        """
+        sweeper = cls.__new__(cls)
+        sweeper.nodes = None
+        sweeper.graph = graph
+        sweeper.x = np.frombuffer(graph.x, dtype=np.intc).astype(np.int64)
+        sweeper.y = np.frombuffer(graph.y, dtype=np.intc).astype(np.int64)
+        sweeper.layers = list(graph.layers)
+        sweeper.layer2ids = dict()
+        sweeper.layer2targets = dict()
+        sweeper.layer2sources = dict()
+        up = (np.frombuffer(graph.up_offsets, dtype=np.intc).astype(np.int64),
+              np.frombuffer(graph.up_ids, dtype=np.intc).astype(np.int64))
+        down = (np.frombuffer(graph.down_offsets, dtype=np.intc).astype(np.int64),
+                np.frombuffer(graph.down_ids, dtype=np.intc).astype(np.int64))
+        for level in sweeper.layers:
+            ids = np.frombuffer(graph.layer2members[level], dtype=np.intc).astype(np.int64)
+            sweeper.layer2ids[level] = ids
+            sweeper.layer2targets[level] = gather_csr(*up, ids)
+            sweeper.layer2sources[level] = gather_csr(*down, ids)
+        return sweeper
+
+    def sort_by_xcenter(self, downward, median=False, levels=None):
+        """
+        create_graph.sort_nodes_by_xcenter()と同じ並べ替えを行う(結果はself.xに入る)。
+        Args:
+            downward: Trueなら上の階層から下へ、ターゲットの位置から並べる。Falseなら下から上へ、ソースの位置から並べる。
+            median: Trueなら重心の代わりに中央値を使う。
+            levels: 並べ替える階層の集合。Noneなら全ての階層。
+        """
+        layers = self.layers if downward else reversed(self.layers)
+        layer2csr = self.layer2targets if downward else self.layer2sources
+        for level in layers:
+            if levels is not None and level not in levels:
+                continue
+            ids = self.layer2ids[level]
+            centers = self.calc_centers(layer2csr[level], len(ids), median)
+            # 重心の昇順、等しければ今のx座標の順
+            order = np.lexsort((self.x[ids], centers))
+            self.x[ids[order]] = np.arange(len(ids))
+
+    def calc_centers(self, csr, n, median):
+        """
+        CSRの各行について、接続先のx座標の重心(median=Trueなら中央値)を求める。接続先がなければ正の無限大。
+        """
+        indptr, indices, rows = csr
+        degrees = np.diff(indptr)
+        centers = np.full(n, np.inf)
+        has_neighbour = degrees > 0
+        values = self.x[indices]
+        if median:
+            # 行ごとに接続先のx座標を昇順に並べ、中央の1つ(偶数個なら2つの平均)を取る
+            values = values[np.lexsort((values, rows))]
+            starts = indptr[:-1][has_neighbour]
+            d = degrees[has_neighbour]
+            centers[has_neighbour] = (values[starts + (d - 1) // 2] + values[starts + d // 2]) / 2
+        else:
+            sums = np.bincount(rows, weights=values, minlength=n)
+            centers[has_neighbour] = sums[has_neighbour] / degrees[has_neighbour]
+        return centers
+
+    def count_cross(self, levels=None):
+        """
+        create_graph.count_cross()と同じ交差数を数える。
+        ターゲットの階層とソースの階層の組ごとに、エッジをソースのx座標、ターゲットのx座標の順に並べ、
+        ターゲットのx座標の転倒数を数える。
+        Args:
+            levels: 階層の集合。与えられた場合は、どちらかの端がこれに含まれるエッジの間の交差だけを数える。
+        """
+        cross_counter = 0
+        for level in self.layers:
+            ids = self.layer2ids[level]
+            indptr, indices, rows = self.layer2sources[level]
+            if len(indices) == 0:
+                continue
+            source_x = self.x[indices]
+            target_x = self.x[ids][rows]
+            source_levels = self.y[indices]
+            for source_level in np.unique(source_levels):
+                if levels is not None and level not in levels and int(source_level) not in levels:
+                    continue
+                mask = source_levels == source_level
+                s = source_x[mask]
+                t = target_x[mask]
+                cross_counter += count_inversions(t[np.lexsort((t, s))])
+        return cross_counter
+
+    def get_x(self):
+        """今のx座標の配列のコピーを返す。"""
+        return self.x.copy()
+
+    def set_x(self, x):
+        """x座標の配列を置き換える。"""
+        self.x[:] = x
+
+    def write_back(self):
+        """self.xを各Nodeオブジェクト(またはLayeredGraph)のxに書き戻す。"""
+        if self.graph is not None:
+            self.graph.set_x(self.x.tolist())
+            return
+        for node, x in zip(self.nodes, self.x.tolist()):
+            node.x = x
+
+
+def make_csr(neighbour_sets, node2id):
+    """
+    ノードの集合のリストをCSR形式に変換する。
+    Args:
+        neighbour_sets: 各行のノード(Nodeオブジェクト)の集合のリスト
+        node2id: key=Nodeオブジェクト, value=ノードID の辞書
+    Return:
+        (indptr, indices, rows)。LayerSweeperを参照。
+    """
+    degrees = np.fromiter((len(s) for s in neighbour_sets), dtype=np.int64, count=len(neighbour_sets))
+    indptr = np.zeros(len(neighbour_sets) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    indices = np.fromiter((node2id[n] for s in neighbour_sets for n in s), dtype=np.int64, count=int(indptr[-1]))
+    rows = np.repeat(np.arange(len(neighbour_sets)), degrees)
+    return indptr, indices, rows
+
+
+def gather_csr(offsets, ids, rows):
+    """
+    全体のCSR(offsets, ids)から、rowsの行だけを取り出したCSRを作る。
+    Return:
+        (indptr, indices, rows)。LayerSweeperを参照。
+    """
+    degrees = offsets[rows + 1] - offsets[rows]
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(degrees, out=indptr[1:])
+    positions = np.arange(indptr[-1]) - np.repeat(indptr[:-1], degrees) + np.repeat(offsets[rows], degrees)
+    return indptr, ids[positions], np.repeat(np.arange(len(rows)), degrees)
+
+
+def count_inversions(values):
+    """
+    i < j かつ values[i] > values[j] となる組の数を数える。
+    値を順位に置き換え、上位のビットから順に、上位ビットが等しいグループ内で
+    「ビットが1の要素が0の要素より前にある」組を数える(組ごとに、異なる最上位のビットで1回だけ数えられる)。
+    Args:
+        values: 1次元の配列
+    Return:
+        組の数(int)
+    """
+    if len(values) < 2:
+        return 0
+    ranks = np.unique(values, return_inverse=True)[1].ravel()
+    inversions = 0
+    for b in range(int(ranks.max()).bit_length()):
+        prefix = ranks >> (b + 1)
+        order = np.argsort(prefix, kind="stable")
+        prefix = prefix[order]
+        bit = (ranks[order] >> b) & 1
+        ones = np.cumsum(bit) - bit  # 自身より前にあるビットが1の要素の数
+        group_start = np.flatnonzero(np.r_[True, prefix[1:] != prefix[:-1]])
+        group = np.cumsum(np.r_[True, prefix[1:] != prefix[:-1]]) - 1
+        ones_in_group = ones - ones[group_start][group]
+        inversions += int(ones_in_group[bit == 0].sum())
+    return inversions
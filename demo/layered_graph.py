@@ -0,0 +1,418 @@
+"""
+階層割当を終えたNodeStoreから、交差削減・座標決定に使う階層グラフを作る。
+create_graph.cut_edges_higher_than_1()のように、階層が2以上離れたエッジをダミーノードの列に置き換えることはしない。
+そのようなエッジ(長いエッジ)は1本につき1つの記録とし、途中の各階層での位置だけを配列に持つ。
+途中の階層での位置(区間)は、交差削減ではダミーノードと同じく階層の要素(メンバ)として扱う。
+
+メンバのID
+    0 ～ n-1: 実在するノード(NodeStoreのノードID)
+    n ～ : 長いエッジの区間。長いエッジeの区間はn+long_edge_offsets[e] ～ n+long_edge_offsets[e+1]-1で、
+           ターゲットに近い(階層が小さい)順に並ぶ。
+隣接するメンバ(1つ上・1つ下の階層にあるもの)はCSR形式で持つ。
+    up: 1つ上の階層(ターゲット側)のメンバ。ダミーノードを挿入した場合のtargetsに相当する。
+    down: 1つ下の階層(ソース側)のメンバ。ダミーノードを挿入した場合のsourcesに相当する。
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+# ダミーノード(区間)の座標更新の優先度。create_graph.calc_priority()と同じ値
+DUMMY_PRIORITY = 9999999999999999999999999999
+
+
+class LayeredGraph:
+    """
+    長いエッジを区間の配列として持つ階層グラフ。
+
+    Attributes:
+        store: 階層割当済みのNodeStore
+        n: 実在するノードの数
+        x, y: x[m], y[m]はメンバmのx座標と階層。array('i')。
+        long_edge_sources, long_edge_targets: 長いエッジのソースとターゲットのノードID。array('i')。
+        long_edge_offsets: 長いエッジの区間の位置。array('i')。
+        layers: 階層の値の昇順のリスト
+        layer2members: key=階層, value=その階層のメンバIDのarray('i') の辞書
+        up_offsets, up_ids, down_offsets, down_ids: 隣接するメンバのCSR。array('i')。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        n = len(store)
+        self.n = n
+        y = store.y
+        target_offsets = store.target_offsets
+        target_ids = store.target_ids
+
+        # 長いエッジの記録
+        self.long_edge_sources = array('i')
+        self.long_edge_targets = array('i')
+        self.long_edge_offsets = array('i', [0])
+        slot2edge = array('i', [-1]) * len(target_ids)  # target_idsの各エッジに対応する長いエッジ。なければ-1
+        for i in range(n):
+            for k in range(target_offsets[i], target_offsets[i + 1]):
+                t = target_ids[k]
+                span = y[i] - y[t]
+                if span > 1:
+                    slot2edge[k] = len(self.long_edge_sources)
+                    self.long_edge_sources.append(i)
+                    self.long_edge_targets.append(t)
+                    self.long_edge_offsets.append(self.long_edge_offsets[-1] + span - 1)
+        segment_count = self.long_edge_offsets[-1]
+
+        self.y = array('i', y)
+        for e, t in enumerate(self.long_edge_targets):
+            self.y.extend(range(y[t] + 1, y[t] + 1 + self.long_edge_offsets[e + 1] - self.long_edge_offsets[e]))
+
+        # 1つ上の階層のメンバ。実在するノードはターゲットの数だけ、区間は1つずつ持つ
+        self.up_offsets = array('i', target_offsets)
+        self.up_offsets.extend(range(len(target_ids) + 1, len(target_ids) + 1 + segment_count))
+        self.up_ids = array('i', target_ids)
+        for k, e in enumerate(slot2edge):
+            if e >= 0:
+                # ソースのすぐ上は、長いエッジの最後の区間
+                self.up_ids[k] = n + self.long_edge_offsets[e + 1] - 1
+        for e, t in enumerate(self.long_edge_targets):
+            start, end = self.long_edge_offsets[e], self.long_edge_offsets[e + 1]
+            self.up_ids.append(t)
+            self.up_ids.extend(range(n + start, n + end - 1))
+
+        # 1つ下の階層のメンバ。実在するノードはソースの数だけ、区間は1つずつ持つ
+        self.down_offsets = array('i', store.source_offsets)
+        self.down_offsets.extend(range(len(target_ids) + 1, len(target_ids) + 1 + segment_count))
+        self.down_ids = array('i', [0]) * len(target_ids)
+        fill = array('i', store.source_offsets)
+        for i in range(n):
+            for k in range(target_offsets[i], target_offsets[i + 1]):
+                t = target_ids[k]
+                e = slot2edge[k]
+                # ターゲットのすぐ下は、長いエッジの最初の区間
+                self.down_ids[fill[t]] = i if e < 0 else n + self.long_edge_offsets[e]
+                fill[t] += 1
+        for e, s in enumerate(self.long_edge_sources):
+            start, end = self.long_edge_offsets[e], self.long_edge_offsets[e + 1]
+            self.down_ids.extend(range(n + start + 1, n + end))
+            self.down_ids.append(s)
+
+        # 階層ごとのメンバ。実在するノード、区間の順に並べ、その順にx座標を割り当てる
+        self.layer2members = dict()
+        for m, level in enumerate(self.y):
+            members = self.layer2members.get(level)
+            if members is None:
+                members = self.layer2members[level] = array('i')
+            members.append(m)
+        self.layers = sorted(self.layer2members)
+        self.x = array('i', [0]) * len(self.y)
+        for members in self.layer2members.values():
+            for position, m in enumerate(members):
+                self.x[m] = position
+
+    def __len__(self):
+        """メンバの数"""
+        return len(self.y)
+
+    @property
+    def segment_count(self):
+        """長いエッジの区間の数(ダミーノードを挿入した場合のダミーノードの数)"""
+        return self.long_edge_offsets[-1]
+
+    def up(self, m):
+        """メンバmの1つ上の階層のメンバ"""
+        return self.up_ids[self.up_offsets[m]:self.up_offsets[m + 1]]
+
+    def down(self, m):
+        """メンバmの1つ下の階層のメンバ"""
+        return self.down_ids[self.down_offsets[m]:self.down_offsets[m + 1]]
+
+    def long_edge_x(self, e):
+        """長いエッジeの途中の各階層でのx座標(ターゲットに近い順)"""
+        return self.x[self.n + self.long_edge_offsets[e]:self.n + self.long_edge_offsets[e + 1]]
+
+    def is_segment(self, m):
+        return m >= self.n
+
+    def sort_by_xcenter(self, downward, median=False, levels=None):
+        """
+        create_graph.sort_nodes_by_xcenter()と同じ並べ替えを、区間を含むメンバに対して行う。
+        Args:
+            downward: Trueなら上の階層から下へ、1つ上のメンバの位置から並べる。
+                      Falseなら下の階層から上へ、1つ下のメンバの位置から並べる。
+            median: Trueなら重心の代わりに中央値を使う。
+            levels: 並べ替える階層の集合。Noneなら全ての階層。
+        """
+        offsets, ids = (self.up_offsets, self.up_ids) if downward else (self.down_offsets, self.down_ids)
+        x = self.x
+        for level in self.iter_layers(downward, levels):
+            members = self.layer2members[level]
+            centers = dict()
+            for m in members:
+                xs = [x[k] for k in ids[offsets[m]:offsets[m + 1]]]
+                centers[m] = calc_center(xs, median)
+            for position, m in enumerate(sorted(members, key=lambda m: (centers[m], x[m]))):
+                x[m] = position
+
+    def iter_layers(self, downward, levels=None):
+        """階層を上から(downward=Falseなら下から)順に返す。levelsが与えられた場合はそれに含まれる階層だけ。"""
+        layers = self.layers if downward else reversed(self.layers)
+        return layers if levels is None else (level for level in layers if level in levels)
+
+    def seed_x(self, name2x, edge2bends, levels):
+        """
+        以前の配置のx座標を初期値として入れる。
+        levelsの階層は、初期値の順に並べた位置(0, 1, ...)にする。それ以外の階層は初期値をそのまま使うので、
+        以前の配置と同じメンバからなる階層であること。
+        初期値
+            実在するノード: name2xにあればその値。なければ、name2xにある隣接ノードのx座標の平均。
+                           それもなければ階層の右端。
+            長いエッジの区間: edge2bendsに同じ長さのbendsがあればその値。なければ両端のx座標を線形補間する。
+        Args:
+            name2x: key=ノードの名前, value=以前のx座標 の辞書
+            edge2bends: key=(ソースの名前, ターゲットの名前), value=以前の"bends"(to_cytoscape()を参照) の辞書
+            levels: 位置を並べ直す階層の集合
+        Return:
+            位置を並べ直した階層の集合。levelsと、初期値のないメンバがある階層。
+        """
+        store = self.store
+        n = self.n
+        seed = [float('infinity')] * len(self.y)
+        for i in range(n):
+            if store.names[i] in name2x:
+                seed[i] = name2x[store.names[i]]
+        for i in range(n):
+            if store.names[i] not in name2x:
+                xs = [name2x[store.names[j]] for j in store.targets(i) + store.sources(i) if store.names[j] in name2x]
+                if xs:
+                    seed[i] = sum(xs) / len(xs)
+        for e, (s, t) in enumerate(zip(self.long_edge_sources, self.long_edge_targets)):
+            start, end = n + self.long_edge_offsets[e], n + self.long_edge_offsets[e + 1]
+            bends = edge2bends.get((store.names[s], store.names[t]))
+            if bends is not None and len(bends) == end - start:
+                for m, (bend_x, bend_y) in zip(range(start, end), reversed(bends)):
+                    seed[m] = bend_x
+                continue
+            # ターゲット側からソース側へ線形補間する。片方の端しか初期値がなければ、その値にする
+            for k, m in enumerate(range(start, end)):
+                if seed[s] == float('infinity') or seed[t] == float('infinity'):
+                    seed[m] = min(seed[s], seed[t])
+                else:
+                    seed[m] = seed[t] + (seed[s] - seed[t]) * (k + 1) / (end - start + 1)
+        ranked_levels = set()
+        for level, members in self.layer2members.items():
+            # 初期値のないメンバがある階層も並べ直す
+            if level in levels or any(seed[m] == float('infinity') for m in members):
+                ranked_levels.add(level)
+                for position, m in enumerate(sorted(members, key=lambda m: (seed[m], m))):
+                    self.x[m] = position
+            else:
+                for m in members:
+                    self.x[m] = int(seed[m])
+        return ranked_levels
+
+    def count_cross(self, levels=None):
+        """
+        create_graph.count_cross()と同じ交差数を、区間を含むメンバに対して数える。
+        全てのエッジは隣り合う階層の間にあるので、階層ごとにcount_inversions()で数える。
+        Args:
+            levels: 階層の集合。与えられた場合は、どちらかの端がこれに含まれるエッジの間の交差だけを数える。
+        """
+        cross_counter = 0
+        x = self.x
+        for level in self.layers:
+            if levels is not None and level not in levels and level + 1 not in levels:
+                continue
+            edges = [(x[d], x[m]) for m in self.layer2members[level] for d in self.down(m)]
+            cross_counter += count_inversions(edges)
+        return cross_counter
+
+    def get_x(self):
+        """今のx座標の配列のコピーを返す。"""
+        return array('i', self.x)
+
+    def set_x(self, x):
+        """x座標の配列を置き換える。"""
+        self.x[:] = array('i', x)
+
+    def write_back(self):
+        """x座標はself.xに直接書き込んでいるので、何もしない。"""
+
+    def move_closer_to_connected_members(self, downward, levels=None):
+        """
+        create_graph.move_node_closer_to_connected_nodes()と同じ座標更新を、区間を含むメンバに対して行う。
+        区間はダミーノードと同じく優先度を最大とし、実在するノードは隣接するメンバの数を優先度とする。
+        Args:
+            downward: Trueなら上の階層から下へ、1つ上のメンバの平均に近づける。
+                      Falseなら下の階層から上へ、1つ下のメンバの平均に近づける。
+            levels: 座標を更新する階層の集合。Noneなら全ての階層。
+        """
+        offsets, ids = (self.up_offsets, self.up_ids) if downward else (self.down_offsets, self.down_ids)
+        x = self.x
+        is_dummy = self.store.is_dummy
+        for level in self.iter_layers(downward, levels):
+            members = sorted(self.layer2members[level], key=lambda m: x[m])
+            idealxs = list()
+            priorities = list()
+            for m in members:
+                xs = [x[k] for k in ids[offsets[m]:offsets[m + 1]]]
+                idealxs.append(int(sum(xs) / len(xs)) if xs else x[m])
+                priorities.append(DUMMY_PRIORITY if m >= self.n or is_dummy[m] else len(xs))
+            for m, new_x in zip(members, place_at_idealx([x[m] for m in members], idealxs, priorities)):
+                x[m] = new_x
+
+    def to_node_list(self, node_class):
+        """
+        区間をダミーノードとしたNodeオブジェクトのリストに変換する。
+        create_graph.cut_edges_higher_than_1()を行った後と同じ形のグラフになる。
+        Args:
+            node_class: create_graph.Node
+        """
+        store = self.store
+        node_list = [node_class(name=store.names[i], x=self.x[i], y=self.y[i], href=store.hrefs[i],
+                                is_dummy=bool(store.is_dummy[i])) for i in range(self.n)]
+        node_list.extend(node_class(name="dummy" + str(m - self.n), x=self.x[m], y=self.y[m], is_dummy=True)
+                         for m in range(self.n, len(self.y)))
+        for m, node in enumerate(node_list):
+            for u in self.up(m):
+                node.targets.add(node_list[u])
+                node_list[u].sources.add(node)
+        return node_list
+
+    def to_cytoscape(self):
+        """
+        cytoscape.jsの記述形式(networkx.cytoscape_data()と同じ形)に変換する。
+        長いエッジはソースからターゲットへの1本のエッジとし、途中の各階層での座標を"bends"に
+        ソースに近い順に[x, y]のリストで入れる。ダミーノードは出力しない。
+        """
+        store = self.store
+        nodes = [{"data": {"href": store.hrefs[i], "x": self.x[i], "y": self.y[i], "is_dummy": False,
+                           "id": store.names[i], "value": store.names[i], "name": store.names[i]}}
+                 for i in range(self.n)]
+        edges = list()
+        e = 0  # 長いエッジは__init__()と同じ順に現れる
+        for s, t in store.iter_edges():
+            data = {"source": store.names[s], "target": store.names[t]}
+            if self.y[s] - self.y[t] > 1:
+                start, end = self.n + self.long_edge_offsets[e], self.n + self.long_edge_offsets[e + 1]
+                data["bends"] = [[self.x[m], self.y[m]] for m in reversed(range(start, end))]
+                e += 1
+            edges.append({"data": data})
+        return {"data": [], "directed": True, "multigraph": False, "elements": {"nodes": nodes, "edges": edges}}
+
+
+def place_at_idealx(xs, idealxs, priorities):
+    """
+    1つの階層のx座標を、優先度が大きい順に理想x座標へ近づける。
+    create_graph.update_x_in_priority_order()(以前のupdate_x2idealx_recursively())と同じ結果になる。
+        - 優先度が同じ場合は、x座標の値が小さいほうが先に動く。
+        - 動かすノードは、理想x座標の方向にある隣のノードを、間を詰めたまま押していく。
+          押されたノードの先に隙間があるか、階層の端に着いたら止まる。
+        - 既に動かしたノードは押さず、その手前で止まる。
+    隣同士のノードを押して動かすと、その範囲では z[p] = x[p] - p (pは階層内の位置)が一定になる。
+    xは狭義単調増加なのでzは広義単調増加であり、zを値が一定の区間(ラン)の列として持つ。
+    押す範囲は二分探索で求め、範囲のzの書き換えはランの置き換えで行うので、
+    1回の移動は押したノードの数によらず O(log n) (と配列のずらし)で済む。
+    Args:
+        xs: x座標の昇順に並べた、1つの階層のノードのx座標のリスト。値は互いに異なること。
+        idealxs: idealxs[p]はxs[p]のノードの理想x座標(int)
+        priorities: priorities[p]はxs[p]のノードの優先度
+    Return:
+        更新後のx座標のリスト(並び順は変わらない)
+    """
+    n = len(xs)
+    # ラン k は位置 starts[k] ～ starts[k+1]-1 で、z = values[k]
+    starts = list()
+    values = list()
+    for p, x in enumerate(xs):
+        if not values or values[-1] != x - p:
+            starts.append(p)
+            values.append(x - p)
+    assigned = list()  # 動かし終えたノードの位置(昇順)
+
+    def z_at(p):
+        return values[bisect_right(starts, p) - 1]
+
+    def assign(first, last, z):
+        """位置first～lastのzをzにする。"""
+        k = bisect_right(starts, first) - 1
+        l = bisect_right(starts, last) - 1
+        new_starts = [first]
+        new_values = [z]
+        if starts[k] < first:
+            new_starts.insert(0, starts[k])
+            new_values.insert(0, values[k])
+        if last + 1 < n and (l + 1 == len(starts) or starts[l + 1] > last + 1):
+            new_starts.append(last + 1)
+            new_values.append(values[l])
+        starts[k:l + 1] = new_starts
+        values[k:l + 1] = new_values
+
+    order = sorted(range(n), key=lambda p: (-priorities[p], xs[p]))
+    for p in order:
+        c = idealxs[p] - p
+        if z_at(p) < c:
+            # 右へ押す。z >= c となる最初の位置(隙間)か、動かし終えたノードの手前まで
+            k = bisect_left(values, c)
+            gap = n if k == len(values) else max(starts[k], p + 1)
+            a = bisect_right(assigned, p)
+            wall = n if a == len(assigned) else assigned[a]
+            assign(p, min(gap, wall) - 1, c if gap <= wall else z_at(wall))
+        else:
+            # 左へ押す。z <= c となる最後の位置(隙間)か、動かし終えたノードの手前まで
+            k = bisect_right(values, c) - 1
+            gap = -1 if k < 0 else min(starts[k + 1] - 1 if k + 1 < len(starts) else n - 1, p - 1)
+            a = bisect_left(assigned, p)
+            wall = -1 if a == 0 else assigned[a - 1]
+            assign(max(gap, wall) + 1, p, c if gap >= wall else z_at(wall))
+        insort(assigned, p)
+    return [z_at(p) + p for p in range(n)]
+
+
+def calc_center(xs, median=False):
+    """
+    x座標のリストの重心(median=Trueなら中央値)を求める。空なら正の無限大。
+    create_graph.calc_xcenter(), calc_xmedian()と同じ値になる。
+    """
+    if not xs:
+        return float('infinity')
+    if not median:
+        return sum(xs) / len(xs)
+    xs = sorted(xs)
+    middle = len(xs) // 2
+    if len(xs) % 2:
+        return float(xs[middle])
+    return (xs[middle - 1] + xs[middle]) / 2
+
+
+def count_inversions(edges):
+    """
+    エッジ(s1, t1), (s2, t2)のうち、s1 < s2 かつ t1 > t2 となる組の数を数える。
+    エッジをsの昇順に見ていき、既に見たエッジのうちtが大きいものの数をFenwick木で求める。
+    sが等しいエッジ同士は交差しないので、まとめて数えてから木に加える。
+    Args:
+        edges: (ソースのx座標, ターゲットのx座標)のタプルのリスト
+    Return:
+        組の数(int)
+    """
+    t2rank = {t: i + 1 for i, t in enumerate(sorted({t for s, t in edges}))}
+    tree = [0] * (len(t2rank) + 1)
+    edges = sorted(edges)
+    inversions = 0
+    inserted = 0
+    i = 0
+    while i < len(edges):
+        j = i
+        while j < len(edges) and edges[j][0] == edges[i][0]:
+            j += 1
+        for s, t in edges[i:j]:
+            # 既に見たエッジのうち、tが今のt以下のものの数
+            r = t2rank[t]
+            not_greater = 0
+            while r > 0:
+                not_greater += tree[r]
+                r -= r & -r
+            inversions += inserted - not_greater
+        for s, t in edges[i:j]:
+            r = t2rank[t]
+            while r < len(tree):
+                tree[r] += 1
+                r += r & -r
+        inserted += j - i
+        i = j
+    return inversions
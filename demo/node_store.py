@@ -0,0 +1,306 @@
+"""
+ノードの情報をNodeオブジェクトではなく、ノードIDを添字とする配列で持つ。
+大きなグラフ(MML全体)の階層化で、ノード1個ごとのオブジェクトや集合のメモリを使わないようにする。
+
+配列
+    names, hrefs: ノードの名前とリンク。文字列はsys.intern()で共有する。
+    x, y: 座標。array('i')。
+    is_dummy: ダミーかどうか。bytearray。
+    target_offsets, target_ids: ノードiのターゲットはtarget_ids[target_offsets[i]:target_offsets[i+1]](CSR形式)。
+    source_offsets, source_ids: 同様にソース。ターゲットから作る。
+メモリはノード数とエッジ数に比例し、Pythonのオブジェクト1個あたりの余分な領域はかからない。
+
+create_graph.pyの間引き(remove_waste_edges)と階層割当(assign_level)と同じ処理をメソッドとして持ち、
+結果は同じになる。その後の処理はto_node_list()でNodeオブジェクトに変換して行う。
+"""
+import heapq
+import sys
+from array import array
+from collections import deque
+
+
+class NodeStore:
+    """
+    ノードを整数IDで表し、属性を配列で持つグラフ。
+    ノードIDは入力の順に0から振る。
+
+    Attributes:
+        names: names[i]はノードiの名前
+        name2id: key=名前, value=ノードID の辞書
+        hrefs: hrefs[i]はノードiのリンク
+        x, y: x[i], y[i]はノードiの座標。array('i')。初期値は-1。
+        is_dummy: is_dummy[i]はノードiがダミーなら1。bytearray。
+        target_offsets, target_ids, source_offsets, source_ids: ターゲットとソースのCSR。array('i')。
+    """
+
+    def __init__(self, names, hrefs, target_lists):
+        """
+        Args:
+            names: ノードの名前のリスト
+            hrefs: ノードのリンクのリスト
+            target_lists: target_lists[i]はノードiのターゲットのノードIDのiterable
+        """
+        self.names = names
+        self.name2id = {name: i for i, name in enumerate(names)}
+        self.hrefs = hrefs
+        n = len(names)
+        self.x = array('i', [-1]) * n
+        self.y = array('i', [-1]) * n
+        self.is_dummy = bytearray(n)
+        self.target_offsets = array('i', [0])
+        self.target_ids = array('i')
+        for targets in target_lists:
+            self.target_ids.extend(targets)
+            self.target_offsets.append(len(self.target_ids))
+        self._make_sources()
+
+    @classmethod
+    def from_input_nodes(cls, input_node_dict):
+        """
+        create_graph.create_node_list()と同じ入力からNodeStoreを作る。
+        Args:
+            input_node_dict: {名前: [ターゲットの名前の集合, リンク]}の辞書、または(名前, [ターゲットの名前の集合, リンク])のiterable
+        Raises:
+            KeyError: 入力のkeyに現れないターゲットがある場合
+        """
+        items = input_node_dict.items() if isinstance(input_node_dict, dict) else input_node_dict
+        names = list()
+        hrefs = list()
+        target_names = list()
+        for k, v in items:
+            names.append(sys.intern(k))
+            hrefs.append(sys.intern(v[1]))
+            target_names.append(list(v[0]))
+        name2id = {name: i for i, name in enumerate(names)}
+        store = cls(names, hrefs, ([name2id[t] for t in ts] for ts in target_names))
+        return store
+
+    @classmethod
+    def from_node_list(cls, node_list):
+        """Nodeオブジェクトのリストから作る。座標とis_dummyも写す。"""
+        node2id = {node: i for i, node in enumerate(node_list)}
+        store = cls([sys.intern(node.name) for node in node_list], [sys.intern(node.href) for node in node_list],
+                    ([node2id[t] for t in node.targets] for node in node_list))
+        for i, node in enumerate(node_list):
+            store.x[i] = node.x
+            store.y[i] = node.y
+            store.is_dummy[i] = node.is_dummy
+        return store
+
+    def _make_sources(self):
+        """ターゲットのCSRからソースのCSRを作る。"""
+        n = len(self.names)
+        counts = array('i', [0]) * (n + 1)
+        for t in self.target_ids:
+            counts[t + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        self.source_offsets = array('i', counts)
+        self.source_ids = array('i', [0]) * len(self.target_ids)
+        for i in range(n):
+            for k in range(self.target_offsets[i], self.target_offsets[i + 1]):
+                t = self.target_ids[k]
+                self.source_ids[counts[t]] = i
+                counts[t] += 1
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def edge_count(self):
+        return len(self.target_ids)
+
+    def targets(self, i):
+        """ノードiのターゲットのノードIDの配列"""
+        return self.target_ids[self.target_offsets[i]:self.target_offsets[i + 1]]
+
+    def sources(self, i):
+        """ノードiのソースのノードIDの配列"""
+        return self.source_ids[self.source_offsets[i]:self.source_offsets[i + 1]]
+
+    def iter_edges(self):
+        """全エッジを(ソースのノードID, ターゲットのノードID)として返す。"""
+        for i in range(len(self.names)):
+            for k in range(self.target_offsets[i], self.target_offsets[i + 1]):
+                yield i, self.target_ids[k]
+
+    def weakly_connected_components(self):
+        """
+        エッジの向きを無視して、つながっているノードをまとめる。
+        Return:
+            成分ごとのノードIDのarray('i')のリスト。成分は最小のノードIDの順、成分内はノードIDの昇順。
+            エッジを持たないノードは、それだけで1つの成分になる。
+        """
+        n = len(self.names)
+        component = array('i', [-1]) * n
+        components = list()
+        for root in range(n):
+            if component[root] >= 0:
+                continue
+            c = len(components)
+            component[root] = c
+            members = array('i', [root])
+            stack = [root]
+            while stack:
+                i = stack.pop()
+                for j in self.targets(i) + self.sources(i):
+                    if component[j] < 0:
+                        component[j] = c
+                        members.append(j)
+                        stack.append(j)
+            components.append(array('i', sorted(members)))
+        return components
+
+    def subgraph(self, ids):
+        """
+        idsのノードと、その間のエッジだけを持つNodeStoreを作る。座標とis_dummyも写す。
+        新しいノードIDはidsでの順番になる。
+        Args:
+            ids: ノードIDのシーケンス
+        """
+        old2new = {i: k for k, i in enumerate(ids)}
+        store = type(self)([self.names[i] for i in ids], [self.hrefs[i] for i in ids],
+                           ([old2new[t] for t in self.targets(i) if t in old2new] for i in ids))
+        for k, i in enumerate(ids):
+            store.x[k] = self.x[i]
+            store.y[k] = self.y[i]
+            store.is_dummy[k] = self.is_dummy[i]
+        return store
+
+    def keep_edges(self, keep):
+        """
+        エッジを間引く。
+        Args:
+            keep: keep[k]が偽ならtarget_ids[k]のエッジを取り除く。target_idsと同じ長さのシーケンス。
+        """
+        offsets = array('i', [0])
+        ids = array('i')
+        for i in range(len(self.names)):
+            for k in range(self.target_offsets[i], self.target_offsets[i + 1]):
+                if keep[k]:
+                    ids.append(self.target_ids[k])
+            offsets.append(len(ids))
+        self.target_offsets = offsets
+        self.target_ids = ids
+        self._make_sources()
+
+    def sort_topologically(self):
+        """
+        どのノードもそのターゲットより後になるようにノードIDを並べる(Kahnの方法)。
+        Raises:
+            ValueError: ターゲットを辿ると自分自身に戻るノードがある場合
+        """
+        n = len(self.names)
+        remaining_targets = array('i', (self.target_offsets[i + 1] - self.target_offsets[i] for i in range(n)))
+        queue = deque(i for i in range(n) if remaining_targets[i] == 0)
+        order = array('i')
+        while queue:
+            i = queue.popleft()
+            order.append(i)
+            for s in self.sources(i):
+                remaining_targets[s] -= 1
+                if remaining_targets[s] == 0:
+                    queue.append(s)
+        if len(order) != n:
+            cyclic = next(i for i in range(n) if remaining_targets[i] > 0)
+            raise ValueError("cycle detected at " + self.names[cyclic])
+        return order
+
+    def remove_waste_edges(self):
+        """
+        create_graph.remove_waste_edges()と同じ間引きを行う。
+        他のターゲットを経由しても辿り着けるターゲットへのエッジを取り除く。
+        各ノードの全祖先はノードIDのビット集合(int)で表す。
+        """
+        n = len(self.names)
+        ancestors = [0] * n
+        pending_sources = array('i', (self.source_offsets[i + 1] - self.source_offsets[i] for i in range(n)))
+        keep = bytearray(b'\x01') * len(self.target_ids)
+        for i in self.sort_topologically():
+            start, end = self.target_offsets[i], self.target_offsets[i + 1]
+            direct = 0
+            indirect = 0
+            for t in self.target_ids[start:end]:
+                direct |= 1 << t
+                indirect |= ancestors[t]
+                pending_sources[t] -= 1
+                if pending_sources[t] == 0:
+                    ancestors[t] = 0
+            ancestors[i] = direct | indirect
+            if direct & indirect:
+                for k in range(start, end):
+                    if indirect >> self.target_ids[k] & 1:
+                        keep[k] = 0
+        if not all(keep):
+            self.keep_edges(keep)
+
+    def assign_level(self):
+        """
+        create_graph.assign_level()と同じ階層割当(最長パス法)を行う。
+        エッジを持たないノードには階層を割り当てない(x, yは-1のまま)。
+        Raises:
+            ValueError: 階層を割り当てられないノードがある場合
+        """
+        for i in self.sort_topologically():
+            targets = self.targets(i)
+            if targets:
+                self.y[i] = max(self.y[t] for t in targets) + 1
+                self.x[i] = 0
+            elif self.source_offsets[i + 1] > self.source_offsets[i]:
+                self.y[i] = 0
+                self.x[i] = 0
+
+    def update_level(self, dirty):
+        """
+        assign_level()の結果を、変更のあったノードから辿れる範囲だけ更新する。
+        yには以前の階層割当の結果が入っていること。新しいノードは-1でよい。
+        dirtyのノードから階層を計算し直し、階層が変わったノードのソースを続けて計算し直す。
+        ソースより先にターゲットを計算するように、トポロジカル順に処理する。
+        Args:
+            dirty: 階層が変わりうるノードIDのiterable。追加されたノードと、追加・削除されたエッジの両端。
+        Return:
+            階層が変わったノードIDの集合
+        Raises:
+            ValueError: 階層を割り当てられないノードがある場合
+        """
+        order = self.sort_topologically()
+        position = array('i', [0]) * len(self.names)
+        for k, i in enumerate(order):
+            position[i] = k
+        queued = set(dirty)
+        heap = [(position[i], i) for i in queued]
+        heapq.heapify(heap)
+        changed = set()
+        while heap:
+            _, i = heapq.heappop(heap)
+            targets = self.targets(i)
+            if targets:
+                level = max(self.y[t] for t in targets) + 1
+            elif self.source_offsets[i + 1] > self.source_offsets[i]:
+                level = 0
+            else:
+                level = -1
+            self.x[i] = 0 if level >= 0 else -1
+            if level == self.y[i]:
+                continue
+            self.y[i] = level
+            changed.add(i)
+            for s in self.sources(i):
+                if s not in queued:
+                    queued.add(s)
+                    heapq.heappush(heap, (position[s], s))
+        return changed
+
+    def to_node_list(self, node_class):
+        """
+        Nodeオブジェクトのリストに変換する。
+        Args:
+            node_class: create_graph.Node
+        """
+        node_list = [node_class(name=self.names[i], x=self.x[i], y=self.y[i], href=self.hrefs[i],
+                                is_dummy=bool(self.is_dummy[i])) for i in range(len(self.names))]
+        for i, node in enumerate(node_list):
+            for t in self.targets(i):
+                node.targets.add(node_list[t])
+                node_list[t].sources.add(node)
+        return node_list
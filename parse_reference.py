@@ -1,58 +1,90 @@
-import glob
+import argparse
+import functools
+import hashlib
 import json
 import os
 import re
-import itertools
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from pprint import pprint
 
+from reference_db import ReferenceDB
+from reference_graph import write_csr_graph
+from stage_trace import NULL_TRACER, StageTracer
+
 MML_DIRECTORY_PATH = Path("mml")
+# 解析結果が変わるような変更をparserに加えた場合は値を上げる。古いキャッシュは使われなくなる。
+PARSER_VERSION = 2
 
 
 
-def get_mizfiles_name():
+def get_mizfiles_name(mml_dir=MML_DIRECTORY_PATH):
     """
-    MML_DIRECTORY_PATH内のmizファイルの名前の一覧をリストで取得する
+    mml_dir内のmizファイルの名前の一覧をリストで取得する
+    作業ディレクトリは変更しないので、スレッドからも呼び出せる。
+    Args:
+        mml_dir: mizファイルが置かれているディレクトリ
     """
-    cwd = os.getcwd()
-    try:
-        os.chdir(MML_DIRECTORY_PATH)
-        miz_files = glob.glob("*.miz")
-    finally:
-        os.chdir(cwd)
+    return [p.name for p in Path(mml_dir).glob("*.miz")]
 
-    return miz_files
 
-def read_miz_file(miz_file):
+def read_miz_file(miz_file, mml_dir=MML_DIRECTORY_PATH):
     """
-    引数で指定したmizファイルをreadlinesで読み込む。
+    引数で指定したmizファイルを開き、1行ずつ読み込むイテレータを返す。
+    ファイル全体をメモリに読み込まないので、大きなファイルでもメモリ使用量は増えない。
+    作業ディレクトリは変更しない。
     Args:
         miz_file: 読み込むファイル
+        mml_dir: mizファイルが置かれているディレクトリ
     Return:
-        読み込んだファイルの名前(str)と中身(list)
+        読み込んだファイルの名前(str)と中身を1行ずつ返すイテレータ
     """
-    text_lines = []
+    return article_name(miz_file), iter_miz_lines(Path(mml_dir) / miz_file)
 
-    cwd = os.getcwd()
-    try:
-        os.chdir(MML_DIRECTORY_PATH)
-        with open(miz_file, encoding="utf-8", errors="ignore") as f:
-            # ファイル名の.mizの部分を除去し大文字に
-            file_name = str.upper(miz_file[0:-4])
-            text_lines = f.readlines()
 
-    finally:
-        os.chdir(cwd)
+def article_name(miz_file):
+    """
+    mizファイルの名前から記事の名前を求める。
+    ファイル名の.mizの部分を除去し大文字にする(例:abcmiz_0.miz -> ABCMIZ_0)。
+    """
+    return str.upper(miz_file[0:-4])
+
+
+def iter_miz_lines(miz_path):
+    """
+    mizファイルを1行ずつ返す。最後まで読むとファイルを閉じる。
+    Args:
+        miz_path: mizファイルのパス
+    """
+    with open(miz_path, encoding="utf-8", errors="ignore") as f:
+        yield from f
+
 
-    return file_name, text_lines
+# 行の判定に使う正規表現。1行ごとにコンパイルし直さないよう、モジュール読み込み時にまとめて用意する
+THEOREM_PATTERN = re.compile(r"\btheorem\b")
+THEOREM_LABEL_PATTERN = re.compile(r"theorem\s+([a-zA-Z0-9]+):")
+DEFINITION_PATTERN = re.compile(r"\bdefinition\b")
+DEFPRED_PATTERN = re.compile(r"\bdefpred\b")
+DEFPRED_END_PATTERN = re.compile(r"\bdefpred\b.*;")
+DEF_LABEL_PATTERN = re.compile(r":([a-zA-Z0-9]+):")
+QUOTED_PART_PATTERN = re.compile(r"\sby.*\.=|\sby.*;|\sfrom.*\(|\sfrom .*;")
+QUOTED_PART_LF_PATTERN = re.compile(r"by.*\n|from.*\n")
+QUOTED_PART_NOISE_PATTERN = re.compile(r"by|from|\s|;|\n|\.=|\(")
+DIGIT_PATTERN = re.compile(r"\d+")
+NON_DIGIT_PATTERN = re.compile(r"\D*")
 
 
 def make_quotation_dict(file_name, text_lines, quotation_dict):
     """
-    mizファイルから引用部を抜き出した辞書を作成する
+    mizファイルから引用部を抜き出した辞書を作成する。
+    theorem・definitionの番号付けとラベルの収集を1回の走査で行い、
+    ラベルによる引用(Th1, Def1等)の番号への変換は、前方参照にも対応できるよう走査の最後にまとめて行う。
     Args:
         file_name: ファイル名(例:ABCMIZ_0)
-        text_lines: ファイルの中身をリストで保持
+        text_lines: ファイルの中身(行のiterable)
         quotation_dict: 出力を格納するための入れ物
             {
                 "ABCMIZ_0:1" : [参照先のリスト],
@@ -60,9 +92,9 @@ def make_quotation_dict(file_name, text_lines, quotation_dict):
                 ...
             }
     """
+    label_dict = dict()  # ラベルと番号の対応(例: {"Th1": "1", "Def1": "def1"})
+    pending_refs = list()  # (引用元のキー, ラベルを変換する前の引用のリスト)
 
-    label_dict = make_Label_dict(text_lines)
-    
     is_theorem = False
     is_def = False
     is_numbered_definition = False
@@ -71,99 +103,139 @@ def make_quotation_dict(file_name, text_lines, quotation_dict):
     theorem_number = 0
     def_number = 0
     prev_line = ''  # by以降が複数行にわたるときに前の行を保存しておく
-    
-    
+
+    # ラベル用の定義番号。コメント行中のmeans等も数えていた従来の挙動(make_Label_dict)に合わせるため、
+    # 引用用の番号とは別に持つ
+    label_def_number = 0
+    label_defpred_flag = False
+    label_prev_line = ''
+
     for line in text_lines:
-        #print(line) #テスト用
         # theoremの終わり
-        if line == '\n' and is_theorem == True:
+        if is_theorem and line == '\n':
             is_theorem = False
 
         # definitionの終わり判定
-        if line == "end;\n" and is_def == True:
+        if is_def and line == "end;\n":
             is_def = False
             is_numbered_definition = False
 
-        
-        # コメント行読み飛ばし、またCT、CDの処理
-        if re.match(r'::', line):
-            if re.match(r"::\$CT", line):
-                if re.search(r'\d+', line):
-                    theorem_number = theorem_number + int(re.sub("\D*", "", line))
-                else:
-                    theorem_number += 1
-
-            if re.match(r"::\$CD", line):
-                if re.search(r'\d+', line):
-                    def_number = def_number + int(re.sub("\D*", "", line))
-                else:
-                    def_number += 1
+        is_comment = line.startswith("::")
+        if is_comment:
+            # CT(canceled theorem)、CD(canceled definition)の処理
+            if line.startswith("::$CT"):
+                theorem_number += count_canceled(line)
+            elif line.startswith("::$CD"):
+                canceled = count_canceled(line)
+                def_number += canceled
+                label_def_number += canceled
+        else:
+            # theoremの始まり判定
+            if line.startswith("theorem") and THEOREM_PATTERN.match(line):
+                is_theorem = True
+                theorem_number += 1
+                quotation_dict[file_name + ':' + str(theorem_number)] = list()
+                m = THEOREM_LABEL_PATTERN.match(line)
+                if m:
+                    label_dict[m.group(1)] = str(theorem_number)
+                continue
 
-            continue
+            # definitionの始まり判定
+            if line.startswith("definition") and DEFINITION_PATTERN.match(line):
+                is_def = True
+                continue
 
-        # theoremの始まり判定
-        if re.match(r"\btheorem\b", line):
-            is_theorem = True
-            theorem_number += 1
-            quotation_dict[file_name + ':' + str(theorem_number)] = list()
-            continue
+        # definitionのラベルについての処理(コメント行も対象)
+        label_line = line
+        if label_defpred_flag:
+            label_line = label_prev_line + ' ' + label_line
+            label_defpred_flag = False
+        has_defpred = is_def and "defpred" in label_line
+        if has_defpred and DEFPRED_PATTERN.search(label_line) and not DEFPRED_END_PATTERN.search(label_line):
+            label_prev_line = label_line[:-1]
+            label_defpred_flag = True
+        elif is_def:
+            if ("means" in label_line or "equals" in label_line) \
+                    and not (has_defpred and DEFPRED_END_PATTERN.search(label_line)):
+                label_def_number += 1
+            m = DEF_LABEL_PATTERN.search(label_line)
+            if m:
+                label_dict[m.group(1)] = "def" + str(label_def_number)
 
-        # definitionの始まり判定
-        if re.match(r"\bdefinition\b", line):
-            is_def = True
+        # コメント行読み飛ばし
+        if is_comment:
             continue
-        
+
         # defpredが複数行になっている場合それらを一行にまとめる
-        if defpred_flag == True:
+        if defpred_flag:
             line = prev_line + ' ' + line
             defpred_flag = False
-        if is_def == True and re.search(r"\bdefpred\b", line):
-            if re.search(r"\bdefpred\b.*;", line):
-                pass
-            else:
+        has_defpred = "defpred" in line
+        if is_def and has_defpred and DEFPRED_PATTERN.search(line):
+            if not DEFPRED_END_PATTERN.search(line):
                 prev_line = line[:-1]
                 defpred_flag = True
                 continue
 
         # definitionの番号を割り当てる
-        if not re.search(r"\bdefpred\b.*;", line) and re.search(r"means|equals", line) and is_def:
+        if is_def and ("means" in line or "equals" in line) \
+                and not (has_defpred and DEFPRED_END_PATTERN.search(line)):
             def_number += 1
-            is_numbered_definition = True  
+            is_numbered_definition = True
             quotation_dict[file_name + ':def' + str(def_number)] = list()
             continue
 
-        #theoremとdefinitionの中
-        if is_theorem == True or is_def == True and is_numbered_definition == True:
+        # theoremとdefinitionの中
+        if is_theorem or is_def and is_numbered_definition:
 
             # by以降が複数行にわたる時それらを1行にまとめる
             if is_contains_lf:
                 line = prev_line + ' ' + line
                 is_contains_lf = False
 
-            #by～;までに改行が含まれない場合
-            m = re.search(r"\sby.*\.=|\sby.*;|\sfrom.*\(|\sfrom .*;", line):
+            if "by" not in line and "from" not in line:
+                continue
+
+            # by～;までに改行が含まれない場合
+            m = QUOTED_PART_PATTERN.search(line)
             if m:
-                quoted_part = m  # 引用部を文字列のまま抜き出す
-                if quoted_part != None:
-                    quotation = extract_quoted_parts(quoted_part.group(), label_dict, file_name)
-                if quotation:
-                    # theoremの場合キーは"filename:番号"
-                    if is_theorem:
-                        quotation_dict[file_name + ':' + str(theorem_number)].append(quotation)
-                    # definitionの場合キーは"filename:def番号
-                    if is_def and is_numbered_definition:
-                        quotation_dict[file_name + ':def' + str(def_number)].append(quotation)
-                    continue
+                refs = split_quoted_part(m.group())
+                # theoremの場合キーは"filename:番号"
+                if is_theorem:
+                    pending_refs.append((file_name + ':' + str(theorem_number), refs))
+                # definitionの場合キーは"filename:def番号
+                if is_def and is_numbered_definition:
+                    pending_refs.append((file_name + ':def' + str(def_number), refs))
                 continue
 
-            #by～;までに改行が含まれる場合
-            if re.search(r"by.*\n|from.*\n", line):
+            # by～;までに改行が含まれる場合
+            if QUOTED_PART_LF_PATTERN.search(line):
                 prev_line = line.rstrip('\r\n')  # 末尾の改行を除いた部分を保存
                 is_contains_lf = True
                 continue
 
+    # ラベルが全て出揃ってから、引用を"ファイル名:番号"に変換する
+    for key, refs in pending_refs:
+        quotation = rename_quoted_refs(refs, label_dict, file_name)
+        if quotation:
+            quotation_dict[key].append(quotation)
+
     return quotation_dict
 
+
+def count_canceled(line):
+    """
+    ::$CT、::$CDの行から、取り消されたtheorem・definitionの個数を求める。
+    Args:
+        line: ::$CT、::$CDで始まる行(例:"::$CT 3")
+    Return:
+        個数(int)。数字が書かれていなければ1。
+    """
+    if DIGIT_PATTERN.search(line):
+        return int(NON_DIGIT_PATTERN.sub("", line))
+    return 1
+
+
 def extract_quoted_parts(quoted_part, label_dict, filename):
     """
     引用部文字列から引用元だけをリストにまとめる。
@@ -175,120 +247,136 @@ def extract_quoted_parts(quoted_part, label_dict, filename):
     Return:
         引用だけをまとめたリスト
     """
-    removed = re.sub("by|from|\s|;|\n|\.=|\(", '', quoted_part)  # 必要のないものを除去
-    refs = removed.split(',')
-
-    renamed_refs = list()
-
-    #theoremの名前を変更し、同じ命題内での引用を除去
-    for r in refs:
-
-        if r in label_dict:
-            renamed_refs.append(filename + ':' + label_dict[r])
-        else:
-            # 別ファイルからの引用の場合
-            if ':' in r:
-                renamed_refs.append(r)
-            
+    return rename_quoted_refs(split_quoted_part(quoted_part), label_dict, filename)
 
 
-
-    return renamed_refs
-
-        
-def make_Label_dict(text_lines):
+def split_quoted_part(quoted_part):
     """
-    theoremとdefinitionのラベルをまとめたリストをつくる
+    引用部文字列から不要な部分を取り除き、引用ごとに分割する。
     Args:
-        text_lines:
+        quoted_part: 引用部分(例："by ~ ;" , "from ~ ;")
     Return:
-        label_dict: keyがファイル名、valueがラベルと番号をまとめたdict
-                　label_dict = {
-                    Th1: 1,
-                    Th2: 2,
-                    Th4: 4,
-                    ...
-                  }
-    """
-    label_dict = dict()
-    th_num = 0
-    def_num = 0
-    in_def = False
-    prev_line = ''
-    defpred_flag = False
-    for line in text_lines:
-        # ::$CT(canceled theorem)の処理
-        if re.match(r"::\$CT", line):
-            if re.search(r'\d+', line):
-                th_num = th_num + int(re.sub("\D*", "", line))
-            else:
-                th_num += 1
+        引用のリスト(例:["Th1", "TARSKI:def1"])
+    """
+    removed = QUOTED_PART_NOISE_PATTERN.sub('', quoted_part)  # 必要のないものを除去
+    return removed.split(',')
 
-        # ::$CD(canceled definition)の処理
-        if re.match(r"::\$CD", line):
-            if re.search(r'\d+', line):
-                def_num = def_num + int(re.sub("\D*", "", line))
-            else:
-                def_num += 1
-
-        # theoremのラベルについての処理
-        if re.match(r"\btheorem\b",line):
-            # ラベルがあるとき
-            m = re.match(r"theorem\s+([a-zA-Z0-9]+):", line)
-            if m:
-                th_num += 1
-                label_dict[m.group(1)] = str(th_num)
-                continue
-            # ラベルがないとき
-            else:
-                th_num += 1
-                continue
 
+def rename_quoted_refs(refs, label_dict, filename):
+    """
+    同じファイル内のラベルによる引用を"ファイル名:番号"に変換し、
+    ラベルでも別ファイルからの引用でもないもの(命題内のラベル等)を除去する。
+    Args:
+        refs: split_quoted_partで分割した引用のリスト
+        label_dict: ファイル内のtheoremとdefinitionのラベルと番号の辞書
+        filename: ファイルの名前
+    Return:
+        変換後の引用のリスト
+    """
+    renamed_refs = list()
+    for r in refs:
+        if r in label_dict:
+            renamed_refs.append(filename + ':' + label_dict[r])
+        # 別ファイルからの引用の場合
+        elif ':' in r:
+            renamed_refs.append(r)
+    return renamed_refs
 
-        # definitionのラベルについての処理
-        if line == "end;\n" and in_def == True:
-            in_def = False
 
-        if re.match(r"\bdefinition\b", line):
-            in_def = True
-            continue
-    
-        if defpred_flag == True:
-            line = prev_line + ' ' + line
-            defpred_flag = False
-        if in_def == True and re.search(r"\bdefpred\b", line):
-            if re.search(r"\bdefpred\b.*;", line):
-                pass
-            else:
-                prev_line = line[:-1]
-                defpred_flag = True
-                continue
+class SymbolTable:
+    """
+    theorem・definitionの名前(例:"XBOOLE_0:def3")に、初めて現れた順に0から整数IDを割り当てる表。
+    同じ名前の文字列は1つだけ保持し、引用関係は全てIDで扱う。
 
-        if not re.search(r"\bdefpred\b.*;", line) and re.search(r"means|equals", line) and in_def:
-            def_num += 1
+    Attributes:
+        names: IDがインデックスとなる名前のリスト。
+        name2id: key=名前, value=ID の辞書。
+    """
 
-        m = re.search(r":([a-zA-Z0-9]+):", line)
-        if m and in_def:
-            label_dict[re.search(r":([a-zA-Z0-9]+):", line).group(1)] = "def" + str(def_num)
+    def __init__(self):
+        self.names = list()
+        self.name2id = dict()
 
+    def __len__(self):
+        return len(self.names)
 
-    return label_dict
+    def intern(self, name):
+        """nameのIDを返す。初めて現れた名前には新しいIDを割り当てる。"""
+        i = self.name2id.get(name)
+        if i is None:
+            i = len(self.names)
+            self.name2id[name] = i
+            self.names.append(name)
+        return i
 
 
+class QuotationTable:
+    """
+    全記事の引用関係を整数IDで保持する。
+    参照先は記事を追加した時点でフラットにし、重複を除いて(最初に現れた順で)配列に詰める。
+
+    Attributes:
+        symbols: 名前とIDの対応。SymbolTable。
+        quotations: key=引用元のID, value=参照先のIDの配列(array('I')) の辞書。
+                    順番は記事を追加した順、記事の中ではtheorem・definitionが現れた順。
+        articles: key=記事の名前(例:ABCMIZ_0), value=その記事のtheorem・definitionのIDのリスト の辞書。
+    """
 
-def reformat_quotation_dict(quotation_dict):
+    def __init__(self):
+        self.symbols = SymbolTable()
+        self.quotations = dict()
+        self.articles = dict()
+
+    @classmethod
+    def from_quotation_dict(cls, quotation_dict):
+        """make_quotation_dict()の出力からQuotationTableを作る。"""
+        table = cls()
+        table.add_article(quotation_dict)
+        return table
+
+    def add_article(self, article_dict):
+        """
+        make_quotation_dict()で作った1記事分の辞書を追加する。
+        Args:
+            article_dict: {"ABCMIZ_0:1": [参照先のリスト, ...], ...}
+        """
+        intern = self.symbols.intern
+        for key, value in article_dict.items():
+            refs = dict.fromkeys(intern(r) for quotation in value for r in quotation)
+            key_id = intern(key)
+            self.quotations[key_id] = array('I', refs)
+            self.articles.setdefault(key.partition(':')[0], list()).append(key_id)
+
+    def remove_article(self, article):
+        """
+        記事のtheorem・definitionを全て取り除く。
+        取り除いたノードへの参照は、出力時(iter_reformatted_nodes())に除かれる。
+        Args:
+            article: 記事の名前(例:ABCMIZ_0)
+        """
+        for key_id in self.articles.pop(article, list()):
+            del self.quotations[key_id]
+
+    def replace_article(self, article, article_dict):
+        """
+        記事の内容を、make_quotation_dict()で作り直した辞書で置き換える。
+        Args:
+            article: 記事の名前(例:ABCMIZ_0)
+            article_dict: その記事だけから作成したquotation_dict
+        """
+        self.remove_article(article)
+        self.add_article(article_dict)
+
+
+def reformat_quotation_dict(quotation_table):
     """
-    quotation_dictに対してグラフのノード化のために
-        - 参照先のリストをフラットにする
+    quotation_tableに対してグラフのノード化のために
+        - 存在しないtheorem・definitionと自分自身への参照を除く
         - 定理のURLを追加
-    を行う。
+    を行い、名前(str)の辞書に変換する。
     Args:
-        quotation_dict(整形前)
-        {
-            "ABCMIZ_0:1" : [参照先のリスト],
-            "ABCMIZ_0:2" : [],
-            ...
-        }
+        quotation_table: 整形前の引用関係。QuotationTable。
+                         make_quotation_dict()の出力は、QuotationTable.from_quotation_dict()で変換する。
     Return:
         keyが参照元(str)、valueが参照先(list)とURL(str)の辞書
         例:{
@@ -300,44 +388,427 @@ def reformat_quotation_dict(quotation_dict):
             ...
         }
     """
-    # quotation_dictのvalueのリストをフラットに
-    for key, value in quotation_dict.items():
-        quotation_dict[key] = list(set(list(itertools.chain.from_iterable(value))))
+    return dict(iter_reformatted_nodes(quotation_table))
+
+
+def iter_reformatted_nodes(quotation_table):
+    """
+    reformat_quotation_dictと同じ整形を1ノードずつ行い、(key, value)のタプルを順に返す。
+    整形後の辞書全体をメモリ上に作らずに出力したい場合に使う。
+    名前の文字列はSymbolTableが持つものをそのまま使う。
+    Args:
+        quotation_table: 整形前の引用関係。QuotationTable。
+    Return:
+        (参照元(str), {"dependency_articles": 参照先のリスト, "url": 参照元のURL})を返すイテレータ
+    """
+    names = quotation_table.symbols.names
+    quotations = quotation_table.quotations
+    for key_id, refs in quotations.items():
+        key = names[key_id]
+        node = dict()
+        node["dependency_articles"] = [names[r] for r in refs if r in quotations and r != key_id]
+        node["url"] = make_url(key)
+        yield key, node
+
+
+def iter_quotation_nodes(quotation_table, articles=None):
+    """
+    quotation_tableのノードを(名前, 記事の名前, URL, 参照先の名前のリスト)として返す。
+    iter_reformatted_nodes()と違い、存在しないノードへの参照も残す(自分自身への参照は除く)。
+    ReferenceDBへの書き込みに使う。
+    Args:
+        quotation_table: QuotationTable
+        articles: 対象にする記事の名前のリスト。Noneなら全記事。
+    """
+    names = quotation_table.symbols.names
+    if articles is None:
+        articles = quotation_table.articles
+    for article in articles:
+        for key_id in quotation_table.articles.get(article, list()):
+            key = names[key_id]
+            refs = [names[r] for r in quotation_table.quotations[key_id] if r != key_id]
+            yield key, article, make_url(key), refs
+
+
+def make_url(key):
+    """
+    theorem・definitionのMizarのHTML版でのURLを作る。
+    Args:
+        key: theorem・definitionの名前(例:"ABCMIZ_0:1", "ABCMIZ_0:def1")
+    Return:
+        URL(例:"http://mizar.org/version/current/html/abcmiz_0.html#T1")
+    """
+    file_name = str.lower(key.partition(':')[0])
+    # definitionのURL
+    if 'def' in key:
+        return "http://mizar.org/version/current/html/" + file_name + ".html#D" + key.rpartition(':def')[2]
+    # theoremのURL
+    return "http://mizar.org/version/current/html/" + file_name + ".html#T" + key.rpartition(':')[2]
+
+
+def write_nodes(quotation_table, output_path, output_format="json", tracer=NULL_TRACER):
+    """
+    quotation_tableを整形し、ファイルに出力する。
+    出力形式
+        json: インデント付きのJSON(従来のnodes1.jsonと同じ)
+        compact: インデントや空白を省いたJSON
+        ndjson: 1行に1ノード({"ABCMIZ_0:1": {...}})を書くJSON Lines形式
+        csr: ノードを整数IDで表したバイナリ形式(reference_graph.pyを参照)
+        sqlite: SQLiteのデータベース(reference_db.pyを参照)
+    compact, ndjson, csrでは整形後の辞書全体を作らず、1ノードずつ書き出す。
+    Args:
+        quotation_table: 整形前の引用関係。QuotationTable。
+        output_path: 出力先のパス
+        output_format: 出力形式。"json", "compact", "ndjson", "csr", "sqlite"のいずれか。
+        tracer: 整形(reformat_quotation_dict)と書き出し(export)を計測するStageTracer
+    """
+    if output_format == "json":
+        with tracer.span("reformat_quotation_dict"):
+            reformatted = reformat_quotation_dict(quotation_table)
+        with tracer.span("export", format=output_format), open(output_path, mode='w') as f:
+            json.dump(reformatted, f, indent=4)
+        return
 
-    reformatted_dict = dict()
-    for key, value in quotation_dict.items():
-        reformatted_dict[key] = dict()
-        reformatted_dict[key]["dependency_articles"] = list()
+    # json以外は整形しながら書き出すので、まとめて計測する
+    with tracer.span("export", format=output_format):
+        write_streaming_nodes(quotation_table, output_path, output_format)
 
-        for v in value:
-            if v in quotation_dict.keys() and not v is key:
-                reformatted_dict[key]["dependency_articles"].append(v)
 
-        # definitionのURL追加
-        if 'def' in key:
-            reformatted_dict[key]['url'] = "http://mizar.org/version/current/html/"\
-                                + str.lower(re.sub(r':.*', '', key)) + ".html#D" + re.sub(r'.*:def', '', key)
-        # theoremのURL追加
+def write_streaming_nodes(quotation_table, output_path, output_format):
+    """
+    write_nodes()のうち、整形後の辞書全体を作らずに1ノードずつ書き出す形式(json以外)の処理。
+    """
+    if output_format == "sqlite":
+        with ReferenceDB(output_path) as db:
+            db.write_all(iter_quotation_nodes(quotation_table))
+        return
+
+    if output_format == "csr":
+        names = quotation_table.symbols.names
+        write_csr_graph(output_path, [names[k] for k in quotation_table.quotations],
+                        iter_reformatted_nodes(quotation_table))
+        return
+
+    with open(output_path, mode='w') as f:
+        if output_format == "compact":
+            f.write('{')
+            for i, (key, node) in enumerate(iter_reformatted_nodes(quotation_table)):
+                if i:
+                    f.write(',')
+                f.write(json.dumps(key) + ':' + json.dumps(node, separators=(',', ':')))
+            f.write('}')
+
+        elif output_format == "ndjson":
+            for key, node in iter_reformatted_nodes(quotation_table):
+                f.write(json.dumps({key: node}, separators=(',', ':')) + '\n')
+
         else:
-            reformatted_dict[key]['url'] = "http://mizar.org/version/current/html/"\
-                                + str.lower(re.sub(r':.*', '', key)) + ".html#T" + re.sub(r'.*:', '', key)
+            raise ValueError("unknown output format: " + output_format)
 
-    return reformatted_dict
-    
 
-def main():
-    mizfiles = get_mizfiles_name()
-    quotation_dict = dict()
-    
-    for m in mizfiles:
-        print("processing file: " + m)
-        fn, tl = read_miz_file(m)
-        make_quotation_dict(fn, tl, quotation_dict)
+def parse_article(miz_file, cache_dir=None, mml_dir=MML_DIRECTORY_PATH):
+    """
+    1つのmizファイルを読み込み、そのファイル内の引用部をまとめた辞書を作成する。
+    プロセスプールのワーカーから呼び出せるよう、モジュールのトップレベルに置いている。
+    cache_dirが指定された場合、内容が変わっていないファイルはキャッシュから結果を読み込む。
+    Args:
+        miz_file: 読み込むファイル(例:abcmiz_0.miz)
+        cache_dir: 解析結果のキャッシュを置くディレクトリ。Noneならキャッシュを使わない。
+        mml_dir: mizファイルが置かれているディレクトリ
+    Return:
+        そのファイルだけから作成したquotation_dict
+    """
+    if cache_dir is None:
+        fn, tl = read_miz_file(miz_file, mml_dir)
+        return make_quotation_dict(fn, tl, dict())
+
+    miz_path = Path(mml_dir) / miz_file
+    cache_path = Path(cache_dir) / (miz_file[0:-4] + ".json")
+    stat = miz_path.stat()
+    cache = load_article_cache(cache_path)
+
+    # 更新日時とサイズが同じなら内容も同じとみなす。違う場合はハッシュ値で内容を比較する
+    if cache is not None and cache["size"] == stat.st_size and cache["mtime_ns"] == stat.st_mtime_ns:
+        return cache["quotation_dict"]
+    digest = calc_file_hash(miz_path)
+    if cache is not None and cache["sha256"] == digest:
+        article_dict = cache["quotation_dict"]
+    else:
+        fn, tl = read_miz_file(miz_file, mml_dir)
+        article_dict = make_quotation_dict(fn, tl, dict())
+
+    save_article_cache(cache_path, {
+        "parser_version": PARSER_VERSION,
+        "sha256": digest,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "quotation_dict": article_dict
+    })
+    return article_dict
+
+
+def calc_file_hash(path):
+    """
+    ファイルの内容のSHA-256ハッシュ値を求める。
+    Args:
+        path: ファイルのパス
+    Return:
+        ハッシュ値(16進数の文字列)
+    """
+    h = hashlib.sha256()
+    with open(path, mode='rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
 
-    nodes = reformat_quotation_dict(quotation_dict)
-    with open("nodes1.json", mode='w') as f:
-        json.dump(nodes, f, indent=4)
+def load_article_cache(cache_path):
+    """
+    1つのmizファイルの解析結果のキャッシュを読み込む。
+    Args:
+        cache_path: キャッシュファイルのパス
+    Return:
+        キャッシュの内容(dict)。存在しない、壊れている、parserのバージョンが違う場合はNone。
+    """
+    try:
+        with open(cache_path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get("parser_version") != PARSER_VERSION:
+        return None
+    return cache
+
+
+def save_article_cache(cache_path, cache):
+    """
+    1つのmizファイルの解析結果をキャッシュに書き込む。
+    書き込み途中で中断しても壊れたキャッシュが残らないよう、一時ファイルに書いてから置き換える。
+    Args:
+        cache_path: キャッシュファイルのパス
+        cache: 書き込む内容(dict)
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp." + str(os.getpid()))
+    with open(tmp_path, mode='w', encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def timed_parse_article(miz_file, cache_dir=None, mml_dir=MML_DIRECTORY_PATH):
+    """
+    parse_article()の実行時間を計測する。ワーカープロセスでの解析時間を呼び出し元で記録するために使う。
+    Return:
+        (秒数(float), parse_article()の戻り値)
+    """
+    start = time.perf_counter()
+    article_dict = parse_article(miz_file, cache_dir, mml_dir)
+    return time.perf_counter() - start, article_dict
+
+
+def make_quotation_table(mizfiles, workers=1, cache_dir=None, mml_dir=MML_DIRECTORY_PATH, tracer=NULL_TRACER):
+    """
+    全てのmizファイルについてmake_quotation_dictを行い、1つのQuotationTableにまとめる。
+    名前の整数IDへの変換は、記事ごとの結果を受け取った時点で行う。
+    workersが2以上の場合はプロセスプールで並列に処理する。
+    結果はmizfilesの順にマージするため、並列数によらず出力は同じになる。
+    Args:
+        mizfiles: 処理するmizファイルのリスト
+        workers: ワーカープロセスの数。1なら逐次処理。
+        cache_dir: 解析結果のキャッシュを置くディレクトリ。Noneならキャッシュを使わない。
+        mml_dir: mizファイルが置かれているディレクトリ
+        tracer: 記事ごとの解析(parse_article)と整数IDへの変換(add_article)を計測するStageTracer。
+                並列処理の場合、解析はワーカープロセスで計測した時間だけを記録する(メモリは計測しない)。
+    Return:
+        QuotationTable
+    """
+    quotation_table = QuotationTable()
+
+    if workers <= 1:
+        for m in mizfiles:
+            print("processing file: " + m)
+            with tracer.span("parse_article", article=m):
+                article_dict = parse_article(m, cache_dir, mml_dir)
+            with tracer.span("add_article", article=m):
+                quotation_table.add_article(article_dict)
+        tracer.set_counter("articles", len(mizfiles))
+        tracer.set_counter("nodes", len(quotation_table.quotations))
+        return quotation_table
+
+    parse = functools.partial(timed_parse_article, cache_dir=cache_dir, mml_dir=mml_dir)
+    # プロセス間通信の回数を減らすため、ある程度まとめてワーカーに渡す
+    chunksize = max(1, len(mizfiles) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # mapは入力の順に結果を返すので、マージ順は決定的になる
+        for m, (seconds, article_dict) in zip(mizfiles, executor.map(parse, mizfiles, chunksize=chunksize)):
+            print("processed file: " + m)
+            tracer.add_span("parse_article", seconds, article=m)
+            with tracer.span("add_article", article=m):
+                quotation_table.add_article(article_dict)
+
+    tracer.set_counter("articles", len(mizfiles))
+    tracer.set_counter("nodes", len(quotation_table.quotations))
+    return quotation_table
+
+
+def main(workers=1, cache_dir=None, mml_dir=MML_DIRECTORY_PATH, output_path=None, output_format="json",
+         trace_path=None):
+    """
+    mmlディレクトリ内の全てのmizファイルから引用関係を抜き出し、nodes1.json(またはoutput_path)に出力する。
+    Args:
+        workers: 解析に使うワーカープロセスの数。1なら逐次処理。
+        cache_dir: 解析結果のキャッシュを置くディレクトリ。Noneならキャッシュを使わない。
+        mml_dir: mizファイルが置かれているディレクトリ
+        output_path: 出力先のパス。Noneならdefault_output_path()。
+        output_format: 出力形式。write_nodes()を参照。
+        trace_path: 段階ごとの実行時間・ピークメモリをJSONで書き出すパス。Noneなら計測しない。
+                    計測した場合は集計結果も表示する。
+    """
+    tracer = NULL_TRACER if trace_path is None else StageTracer()
+    mizfiles = get_mizfiles_name(mml_dir)
+    with tracer.span("make_quotation_table", workers=workers):
+        quotation_table = make_quotation_table(mizfiles, workers, cache_dir, mml_dir, tracer)
+
+    if output_path is None:
+        output_path = default_output_path(output_format)
+    write_nodes(quotation_table, output_path, output_format, tracer)
+
+    if trace_path is not None:
+        tracer.set_counter("references", sum(len(refs) for refs in quotation_table.quotations.values()))
+        tracer.close()
+        tracer.write_json(trace_path)
+        print(tracer.summary())
+
+
+def default_output_path(output_format):
+    """
+    出力形式ごとのデフォルトの出力先(nodes1.json, nodes1.ndjson, nodes1.csr, nodes1.sqlite)を返す。
+    """
+    return "nodes1." + (output_format if output_format in ("ndjson", "csr", "sqlite") else "json")
+
+
+def scan_mml_dir(mml_dir=MML_DIRECTORY_PATH):
+    """
+    mml_dir内のmizファイルの更新日時とサイズを取得する。
+    Return:
+        key=mizファイルの名前, value=(更新日時(ns), サイズ) の辞書
+    """
+    snapshot = dict()
+    with os.scandir(mml_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(".miz") and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def flush_nodes(quotation_table, output_path, output_format):
+    """
+    write_nodes()で一時ファイルに書き出してから置き換える。
+    読み込む側が書き込み途中のファイルを読むことはない。
+    """
+    tmp_path = str(output_path) + ".tmp"
+    write_nodes(quotation_table, tmp_path, output_format)
+    os.replace(tmp_path, output_path)
+
+
+def watch(output_path, output_format="json", workers=1, cache_dir=None, mml_dir=MML_DIRECTORY_PATH,
+          interval=0.5, stop_event=None):
+    """
+    mml_dirを監視し、mizファイルが追加・削除・変更されるたびに、その記事だけを解析し直して出力を更新する。
+    解析結果はQuotationTableとしてメモリ上に保持し続ける。
+    削除された記事のノードへの参照は、出力時に取り除かれる。
+    Args:
+        output_path: 出力先のパス
+        output_format: 出力形式。write_nodes()を参照。
+        workers: 最初に全記事を解析するときのワーカープロセスの数
+        cache_dir: 解析結果のキャッシュを置くディレクトリ。Noneならキャッシュを使わない。
+        mml_dir: mizファイルが置かれているディレクトリ
+        interval: mml_dirを調べる間隔(秒)
+        stop_event: set()されると監視を終了するthreading.Event。Noneなら終了しない。
+    """
+    stop_event = threading.Event() if stop_event is None else stop_event
+    snapshot = scan_mml_dir(mml_dir)
+    quotation_table = make_quotation_table(list(snapshot), workers, cache_dir, mml_dir)
+    if output_format == "sqlite":
+        # データベースは丸ごと書き直さず、変更された記事の行だけを置き換える
+        db = ReferenceDB(output_path)
+        db.write_all(iter_quotation_nodes(quotation_table))
+    else:
+        db = None
+        flush_nodes(quotation_table, output_path, output_format)
+    print("watching " + str(mml_dir))
+
+    try:
+        while not stop_event.wait(interval):
+            current = scan_mml_dir(mml_dir)
+            changed = [m for m, stat in current.items() if snapshot.get(m) != stat]
+            removed = [m for m in snapshot if m not in current]
+            if not changed and not removed:
+                continue
+
+            for m in removed:
+                print("removed file: " + m)
+                quotation_table.remove_article(article_name(m))
+            for m in changed:
+                print("processing file: " + m)
+                try:
+                    article_dict = parse_article(m, cache_dir, mml_dir)
+                except OSError:
+                    # 調べた後に削除・移動された場合。次回の走査で改めて処理する
+                    current.pop(m)
+                    removed.append(m)
+                    quotation_table.remove_article(article_name(m))
+                    continue
+                quotation_table.replace_article(article_name(m), article_dict)
+
+            if db is not None:
+                for m in changed + removed:
+                    article = article_name(m)
+                    db.replace_article(article, iter_quotation_nodes(quotation_table, [article]))
+            else:
+                flush_nodes(quotation_table, output_path, output_format)
+            snapshot = current
+    finally:
+        if db is not None:
+            db.close()
+
+
+def parse_args():
+    """
+    コマンドライン引数を解析する。
+    """
+    parser = argparse.ArgumentParser(description="MMLの定理・定義の引用関係を抽出する")
+    parser.add_argument("--mml-dir", default=MML_DIRECTORY_PATH, type=Path,
+                        help="mizファイルが置かれているディレクトリ")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="解析に使うワーカープロセスの数(0ならCPU数)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="記事ごとの解析結果をキャッシュするディレクトリ。変更のない記事は再解析しない")
+    parser.add_argument("-o", "--output", default=None,
+                        help="出力先のパス(デフォルトはnodes1.json、ndjson, csr, sqliteの場合はnodes1.<形式>)")
+    parser.add_argument("--watch", action="store_true",
+                        help="mmlディレクトリを監視し、変更された記事だけを解析し直して出力を更新し続ける")
+    parser.add_argument("--interval", type=float, default=0.5, help="--watchで変更を調べる間隔(秒)")
+    parser.add_argument("--format", choices=["json", "compact", "ndjson", "csr", "sqlite"], default="json",
+                        help="出力形式。compactは空白なしのJSON、ndjsonは1行1ノード、csrは整数IDのバイナリ、"
+                             "sqliteはSQLiteのデータベース")
+    parser.add_argument("--trace", default=None, metavar="PATH",
+                        help="段階ごとの実行時間とピークメモリを計測し、JSONでPATHに書き出す(--watchでは無効)")
+    args = parser.parse_args()
+    if args.workers == 0:
+        args.workers = os.cpu_count() or 1
+    return args
+
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.watch:
+        output_path = args.output or default_output_path(args.format)
+        try:
+            watch(output_path, args.format, args.workers, args.cache_dir, args.mml_dir, args.interval)
+        except KeyboardInterrupt:
+            pass
+    else:
+        main(workers=args.workers, cache_dir=args.cache_dir, mml_dir=args.mml_dir,
+             output_path=args.output, output_format=args.format, trace_path=args.trace)
@@ -0,0 +1,243 @@
+"""
+引用関係をSQLiteのデータベースに保存し、必要な部分グラフだけを索引を使って取り出す。
+
+テーブル
+    symbols(id, name): theorem・definitionの名前と整数ID。参照先として現れただけの名前も含む。
+    nodes(id, article, url): 実在するtheorem・definition。idはsymbolsのid。
+    edges(source, ord, target): sourceのord番目の参照先がtarget。
+                                targetがnodesにない(存在しない・削除された)エッジも保存しておき、
+                                問い合わせの際にnodesと結合して取り除く。
+                                こうしておくと、記事単位で置き換えても他の記事からのエッジが失われない。
+索引
+    edges: (source, ord)が主キー。targetに索引。
+    nodes: articleに索引。
+"""
+import sqlite3
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS symbols (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    article TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nodes_article ON nodes(article);
+CREATE TABLE IF NOT EXISTS edges (
+    source INTEGER NOT NULL,
+    ord INTEGER NOT NULL,
+    target INTEGER NOT NULL,
+    PRIMARY KEY (source, ord)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS edges_target ON edges(target);
+"""
+
+
+class ReferenceDB:
+    """
+    引用関係を保存したSQLiteのデータベース。
+    書き込むのは1つのプロセスだけとする(読み込みはWALモードなので並行してよい)。
+
+    Attributes:
+        connection: sqlite3.Connection
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(str(path))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._name2id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    # 書き込み
+
+    def write_all(self, nodes):
+        """
+        データベースの内容を全て消し、nodesで置き換える。1つのトランザクションで行う。
+        Args:
+            nodes: (名前, 記事の名前, URL, 参照先の名前のリスト)のiterable
+        """
+        with self._transaction():
+            self.connection.execute("DELETE FROM edges")
+            self.connection.execute("DELETE FROM nodes")
+            self.connection.execute("DELETE FROM symbols")
+            self._name2id = dict()
+            self._insert_nodes(nodes)
+
+    def replace_article(self, article, nodes):
+        """
+        記事articleのノードとそこから出るエッジを、nodesで置き換える。1つのトランザクションで行う。
+        Args:
+            article: 記事の名前(例:XBOOLE_0)
+            nodes: その記事の(名前, 記事の名前, URL, 参照先の名前のリスト)のiterable。空なら記事を削除する。
+        """
+        with self._transaction():
+            self._delete_article(article)
+            self._insert_nodes(nodes)
+
+    def remove_article(self, article):
+        """記事articleのノードとそこから出るエッジを削除する。"""
+        with self._transaction():
+            self._delete_article(article)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        書き込みのトランザクション。例外が起きたらロールバックし、名前とIDの対応(_name2id)を捨てる。
+        _name2idはトランザクション中に新しい名前を追加するので、ロールバック後はsymbolsと食い違うため。
+        次に使うときにsymbolsから読み直す。
+        """
+        try:
+            with self.connection:
+                yield
+        except BaseException:
+            self._name2id = None
+            raise
+
+    def _delete_article(self, article):
+        self.connection.execute(
+            "DELETE FROM edges WHERE source IN (SELECT id FROM nodes WHERE article = ?)", (article,))
+        self.connection.execute("DELETE FROM nodes WHERE article = ?", (article,))
+
+    def _intern(self, name, new_symbols):
+        """nameのIDを返す。新しい名前ならIDを割り当て、new_symbolsに追加する。"""
+        if self._name2id is None:
+            self._name2id = dict((name, i) for i, name in self.connection.execute("SELECT id, name FROM symbols"))
+        i = self._name2id.get(name)
+        if i is None:
+            # symbolsはwrite_all()以外では削除しないので、IDは常に0から連続している
+            i = len(self._name2id)
+            self._name2id[name] = i
+            new_symbols[i] = name
+        return i
+
+    def _insert_nodes(self, nodes):
+        """nodesをexecutemanyでまとめて挿入する。トランザクションは呼び出し側で開始しておく。"""
+        new_symbols = dict()
+        node_rows = list()
+        edge_rows = list()
+        for name, article, url, dependencies in nodes:
+            source = self._intern(name, new_symbols)
+            node_rows.append((source, article, url))
+            edge_rows.extend((source, k, self._intern(d, new_symbols)) for k, d in enumerate(dependencies))
+        self.connection.executemany("INSERT INTO symbols (id, name) VALUES (?, ?)", new_symbols.items())
+        self.connection.executemany("INSERT INTO nodes (id, article, url) VALUES (?, ?, ?)", node_rows)
+        self.connection.executemany("INSERT INTO edges (source, ord, target) VALUES (?, ?, ?)", edge_rows)
+
+    # 読み込み
+
+    def iter_nodes(self):
+        """
+        全ノードを(名前, 参照先の名前のリスト, URL)として返す(reference_graph.load_nodes()と同じ形式)。
+        参照先は実在するノードだけに絞る。
+        """
+        dependencies = dict()
+        for source, target in self.connection.execute(
+                "SELECT e.source, s.name FROM edges e JOIN nodes n ON n.id = e.target "
+                "JOIN symbols s ON s.id = e.target ORDER BY e.source, e.ord"):
+            dependencies.setdefault(source, list()).append(target)
+        for i, name, url in self.connection.execute(
+                "SELECT n.id, s.name, n.url FROM nodes n JOIN symbols s ON s.id = n.id ORDER BY n.id"):
+            yield name, dependencies.get(i, list()), url
+
+    def node(self, name):
+        """
+        ノードの情報を返す。
+        Return:
+            {"name", "article", "url", "dependencies", "citers"}の辞書。存在しなければNone。
+        """
+        row = self.connection.execute(
+            "SELECT n.id, n.article, n.url FROM nodes n JOIN symbols s ON s.id = n.id WHERE s.name = ?",
+            (name,)).fetchone()
+        if row is None:
+            return None
+        i, article, url = row
+        return {
+            "name": name,
+            "article": article,
+            "url": url,
+            "dependencies": self._names(
+                "SELECT s.name FROM edges e JOIN nodes n ON n.id = e.target JOIN symbols s ON s.id = e.target "
+                "WHERE e.source = ? ORDER BY e.ord", (i,)),
+            "citers": self._names(
+                "SELECT s.name FROM edges e JOIN nodes n ON n.id = e.source JOIN symbols s ON s.id = e.source "
+                "WHERE e.target = ? ORDER BY e.source", (i,))
+        }
+
+    def article_nodes(self, article):
+        """記事articleのノードの名前のリストを返す。"""
+        return self._names(
+            "SELECT s.name FROM nodes n JOIN symbols s ON s.id = n.id WHERE n.article = ? ORDER BY n.id",
+            (article,))
+
+    def subgraph_of_articles(self, articles):
+        """
+        記事articlesのノードからなる部分グラフを、create_graph.create_node_list()の入力の形式で返す。
+        Return:
+            {名前: [部分グラフ内の参照先の名前の集合, URL], ...}
+        """
+        placeholders = ",".join("?" * len(articles))
+        ids = [i for i, in self.connection.execute(
+            f"SELECT id FROM nodes WHERE article IN ({placeholders})", list(articles))]
+        return self._input_node_dict(ids)
+
+    def neighbourhood(self, name, ancestors=1, descendants=1):
+        """
+        nameと、その参照先ancestors世代・参照元descendants世代までのノードからなる部分グラフを、
+        create_graph.create_node_list()の入力の形式で返す。再帰CTEでedgesの索引をたどる。
+        Return:
+            {名前: [部分グラフ内の参照先の名前の集合, URL], ...}
+        """
+        row = self.connection.execute(
+            "SELECT n.id FROM nodes n JOIN symbols s ON s.id = n.id WHERE s.name = ?", (name,)).fetchone()
+        if row is None:
+            return dict()
+        start = row[0]
+        ids = {start}
+        for column, other, depth in (("source", "target", ancestors), ("target", "source", descendants)):
+            ids.update(i for i, in self.connection.execute(
+                f"WITH RECURSIVE reach(id, depth) AS ("
+                f" SELECT ?, 0"
+                f" UNION SELECT e.{other}, reach.depth + 1 FROM edges e JOIN reach ON e.{column} = reach.id"
+                f" JOIN nodes n ON n.id = e.{other} WHERE reach.depth < ?"
+                f") SELECT DISTINCT id FROM reach", (start, depth)))
+        return self._input_node_dict(ids)
+
+    def _input_node_dict(self, ids):
+        """
+        ノードIDの集合から、create_graph.create_node_list()の入力の形式の辞書を作る。
+        IDを一時テーブルに入れ、ノードとその間のエッジをそれぞれ1回の結合で取り出す。
+        """
+        with self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS subgraph_ids (id INTEGER PRIMARY KEY)")
+            self.connection.execute("DELETE FROM subgraph_ids")
+            self.connection.executemany("INSERT OR IGNORE INTO subgraph_ids (id) VALUES (?)", ((i,) for i in ids))
+            input_node_dict = dict()
+            id2name = dict()
+            for i, name, url in self.connection.execute(
+                    "SELECT n.id, s.name, n.url FROM subgraph_ids t JOIN nodes n ON n.id = t.id "
+                    "JOIN symbols s ON s.id = n.id ORDER BY n.id"):
+                id2name[i] = name
+                input_node_dict[name] = [set(), url]
+            # CROSS JOINで結合順を固定し、edgesを全て走査せずに(source, ord)の主キーでたどる
+            for source, target in self.connection.execute(
+                    "SELECT e.source, e.target FROM subgraph_ids s CROSS JOIN edges e ON e.source = s.id "
+                    "JOIN subgraph_ids t ON e.target = t.id WHERE e.source != e.target"):
+                input_node_dict[id2name[source]][0].add(id2name[target])
+            self.connection.execute("DELETE FROM subgraph_ids")
+        return input_node_dict
+
+    def _names(self, query, params):
+        return [name for name, in self.connection.execute(query, params)]
@@ -0,0 +1,216 @@
+"""
+引用関係のグラフを整数IDのCSR(Compressed Sparse Row)形式のバイナリファイルで保存・読み込みする。
+
+ファイルの構成(数値は全てリトルエンディアン)
+    ヘッダ: マジックナンバー(8バイト), ノード数n, エッジ数m, 名前の文字列の長さ, URLの文字列の長さ(各uint64)
+    offsets: ノードiの参照先はtargets[offsets[i]:offsets[i+1]]。uint32 * (n+1)
+    targets: 参照先のノードID。uint32 * m
+    name_offsets, names: ノードiの名前はnames[name_offsets[i]:name_offsets[i+1]](UTF-8)
+    url_offsets, urls: ノードiのURLはurls[url_offsets[i]:url_offsets[i+1]](UTF-8)
+各領域は4バイト境界に揃えて配置する。
+読み込み時はファイルをmmapし、配列はコピーせずにmemoryviewで参照する。
+load_nodes()はこの形式とJSON、NDJSON、SQLiteのどれでも同じように読み込む。
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b"EMGCSR01"
+HEADER = struct.Struct("<8sQQQQ")
+
+
+def write_csr_graph(path, names, nodes):
+    """
+    ノードの参照関係をCSR形式のファイルに書き出す。
+    ノードIDはnamesでの順番(0始まり)とする。
+    Args:
+        path: 出力先のパス
+        names: 全ノードの名前のリスト。
+        nodes: (名前, {"dependency_articles": 参照先の名前のリスト, "url": URL})を
+               namesと同じ順に返すiterable。parse_reference.iter_reformatted_nodes()の出力。
+    """
+    name2id = {name: i for i, name in enumerate(names)}
+    offsets = array('I', [0])
+    targets = array('I')
+    urls = list()
+    for i, (name, node) in enumerate(nodes):
+        assert name2id[name] == i
+        targets.extend(name2id[d] for d in node["dependency_articles"])
+        offsets.append(len(targets))
+        urls.append(node["url"])
+    assert len(offsets) == len(names) + 1
+
+    name_offsets, name_blob = make_string_table(names)
+    url_offsets, url_blob = make_string_table(urls)
+
+    with open(path, mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, len(names), len(targets), len(name_blob), len(url_blob)))
+        for a in (offsets, targets, name_offsets):
+            write_array(f, a)
+        write_padded(f, name_blob)
+        write_array(f, url_offsets)
+        write_padded(f, url_blob)
+
+
+def make_string_table(strings):
+    """
+    文字列のリストを、UTF-8で連結したバイト列と各文字列の開始位置の配列に変換する。
+    Args:
+        strings: 文字列のリスト
+    Return:
+        (開始位置の配列(array('I'), 長さlen(strings)+1), 連結したバイト列)
+    """
+    offsets = array('I', [0])
+    encoded = list()
+    total = 0
+    for s in strings:
+        b = s.encode("utf-8")
+        encoded.append(b)
+        total += len(b)
+        offsets.append(total)
+    return offsets, b"".join(encoded)
+
+
+def write_array(f, a):
+    """
+    array('I')をリトルエンディアンでファイルに書き込む。
+    """
+    if sys.byteorder != "little":
+        a = array('I', a)
+        a.byteswap()
+    a.tofile(f)
+
+
+def write_padded(f, blob):
+    """
+    バイト列を書き込み、4バイト境界まで0で埋める。
+    """
+    f.write(blob)
+    f.write(b"\0" * (-len(blob) % 4))
+
+
+class CSRGraph:
+    """
+    write_csr_graph()で書き出したファイルをmmapで読み込んだグラフ。
+    ノードはID(int)で扱い、名前やURLは必要になったときにだけ文字列に変換する。
+
+    Attributes:
+        offsets: ノードiの参照先はtargets[offsets[i]:offsets[i+1]]。memoryview。
+        targets: 参照先のノードIDを並べたもの。memoryview。
+    """
+
+    def __init__(self, path):
+        with open(path, mode='rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, n, m, name_size, url_size = HEADER.unpack_from(buf)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a CSR graph file")
+
+        pos = HEADER.size
+        self.offsets, pos = self._uint32_array(buf, pos, n + 1)
+        self.targets, pos = self._uint32_array(buf, pos, m)
+        self._name_offsets, pos = self._uint32_array(buf, pos, n + 1)
+        self._names = buf[pos:pos + name_size]
+        pos += name_size + (-name_size % 4)
+        self._url_offsets, pos = self._uint32_array(buf, pos, n + 1)
+        self._urls = buf[pos:pos + url_size]
+        self._name2id = None
+
+    @staticmethod
+    def _uint32_array(buf, pos, count):
+        """
+        bufのposからuint32をcount個読む配列と、その次の位置を返す。
+        ビッグエンディアンの環境ではコピーしてバイト順を入れ替える。
+        """
+        end = pos + 4 * count
+        if sys.byteorder == "little":
+            return buf[pos:end].cast('I'), end
+        a = array('I', bytes(buf[pos:end]))
+        a.byteswap()
+        return memoryview(a), end
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """mmapを閉じる。閉じた後に取り出したmemoryviewは使えない。"""
+        for view in (self.offsets, self.targets, self._name_offsets, self._names,
+                     self._url_offsets, self._urls):
+            view.release()
+        self._mmap.close()
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    def name(self, node_id):
+        """ノードIDから名前を求める"""
+        return str(self._names[self._name_offsets[node_id]:self._name_offsets[node_id + 1]], "utf-8")
+
+    def url(self, node_id):
+        """ノードIDからURLを求める"""
+        return str(self._urls[self._url_offsets[node_id]:self._url_offsets[node_id + 1]], "utf-8")
+
+    def find(self, name):
+        """
+        名前からノードIDを求める。最初に呼ばれたときに名前の辞書を作る。
+        Return:
+            ノードID。存在しなければNone。
+        """
+        if self._name2id is None:
+            self._name2id = {self.name(i): i for i in range(len(self))}
+        return self._name2id.get(name)
+
+    def targets_of(self, node_id):
+        """ノードnode_idの参照先のノードIDのmemoryview"""
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def iter_input_nodes(self):
+        """
+        create_graph.create_node_list()に渡せる(名前, [参照先の名前の集合, URL])を1ノードずつ返す。
+        """
+        for i in range(len(self)):
+            yield self.name(i), [{self.name(t) for t in self.targets_of(i)}, self.url(i)]
+
+
+def load_nodes(path):
+    """
+    parse_reference.pyの出力ファイルを読み込み、1ノードずつ返す。
+    拡張子で形式を判定する(.csr: CSR形式, .ndjson: 1行1ノード, .sqlite: SQLite, それ以外: JSON)。
+    Args:
+        path: nodes1.json, nodes1.ndjson, nodes1.csr, nodes1.sqlite等のパス
+    Return:
+        (名前, 参照先の名前のリスト, URL)を返すイテレータ
+    """
+    path = str(path)
+    if path.endswith(".sqlite"):
+        from reference_db import ReferenceDB
+        with ReferenceDB(path) as db:
+            yield from db.iter_nodes()
+        return
+
+    if path.endswith(".csr"):
+        with CSRGraph(path) as graph:
+            for i in range(len(graph)):
+                yield graph.name(i), [graph.name(t) for t in graph.targets_of(i)], graph.url(i)
+        return
+
+    with open(path) as f:
+        if path.endswith(".ndjson"):
+            for line in f:
+                if not line.strip():
+                    continue
+                for name, node in json.loads(line).items():
+                    yield name, node["dependency_articles"], node["url"]
+        else:
+            for name, node in json.load(f).items():
+                yield name, node["dependency_articles"], node["url"]
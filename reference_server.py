@@ -0,0 +1,246 @@
+"""
+引用関係のグラフを一度だけ読み込み、参照先・参照元・近傍の問い合わせにJSONで答えるHTTPサーバ。
+標準ライブラリのみで動作し、リクエストはスレッドごとに並行して処理する。
+索引は読み込み後に変更しないので、ロックなしで複数のスレッドから参照できる。
+
+例:
+    python reference_server.py nodes1.json --port 8000
+    curl "http://localhost:8000/reverse?name=XBOOLE_0:def3"
+
+エンドポイント(全てGET、名前はクエリ文字列で渡す)
+    /node?name=N                 ノードNのURL、参照先、参照元
+    /forward?name=N&depth=k      Nからk世代先までの参照先(depthを省略すると全て)
+    /reverse?name=N&depth=k      Nをk世代前まで遡った参照元(depthを省略すると全て)
+    /neighbourhood?name=N&ancestors=a&descendants=d
+                                 参照先a世代、参照元d世代までの部分グラフ(ノードとエッジ)
+    /article?name=A              記事Aのノード一覧と、記事単位の参照先・参照元の集計
+"""
+import argparse
+import json
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from reference_graph import load_nodes
+
+
+class ReferenceIndex:
+    """
+    引用関係のグラフの正引き(参照先)と逆引き(参照元)の索引。
+    ノードは読み込んだ順に0から振った整数IDで扱う。
+
+    Attributes:
+        names: IDがインデックスとなるノードの名前のリスト。
+        urls: IDがインデックスとなるノードのURLのリスト。
+        name2id: key=名前, value=ID の辞書。
+        targets: targets[i]はノードiが参照しているノードのIDのタプル。
+        sources: sources[i]はノードiを参照しているノードのIDのタプル。
+        article2nodes: key=記事の名前, value=その記事のノードのIDのリスト の辞書。
+        article_targets: key=記事の名前, value=参照先の記事ごとのエッジ数(Counter) の辞書。
+        article_sources: key=記事の名前, value=参照元の記事ごとのエッジ数(Counter) の辞書。
+    """
+
+    def __init__(self, nodes):
+        """
+        Args:
+            nodes: (名前, 参照先の名前のリスト, URL)のiterable。reference_graph.load_nodes()の出力。
+        """
+        self.names = list()
+        self.urls = list()
+        dependencies = list()
+        for name, dependency_names, url in nodes:
+            self.names.append(name)
+            self.urls.append(url)
+            dependencies.append(dependency_names)
+        self.name2id = {name: i for i, name in enumerate(self.names)}
+
+        self.targets = [tuple(self.name2id[d] for d in ds if d in self.name2id) for ds in dependencies]
+        sources = [list() for _ in self.names]
+        for i, ts in enumerate(self.targets):
+            for t in ts:
+                sources[t].append(i)
+        self.sources = [tuple(s) for s in sources]
+
+        # 記事単位の集計
+        self.article2nodes = dict()
+        self.article_targets = dict()
+        self.article_sources = dict()
+        articles = [name.partition(':')[0] for name in self.names]
+        for i, article in enumerate(articles):
+            self.article2nodes.setdefault(article, list()).append(i)
+            self.article_targets.setdefault(article, Counter())
+            self.article_sources.setdefault(article, Counter())
+        for i, ts in enumerate(self.targets):
+            for t in ts:
+                if articles[i] != articles[t]:
+                    self.article_targets[articles[i]][articles[t]] += 1
+                    self.article_sources[articles[t]][articles[i]] += 1
+
+    @classmethod
+    def load(cls, path):
+        """nodes1.json, nodes1.ndjson, nodes1.csr, nodes1.sqliteのいずれかから索引を作る。"""
+        return cls(load_nodes(path))
+
+    def node(self, name):
+        """ノードのURL、参照先、参照元を返す。"""
+        i = self.name2id[name]
+        return {
+            "name": name,
+            "url": self.urls[i],
+            "dependencies": [self.names[t] for t in self.targets[i]],
+            "citers": [self.names[s] for s in self.sources[i]]
+        }
+
+    def forward(self, name, depth=None):
+        """nameからdepth世代先までに参照している全ノードの名前を、近い順に返す。"""
+        return [self.names[i] for i in self.traverse(self.name2id[name], self.targets, depth)]
+
+    def reverse(self, name, depth=None):
+        """nameをdepth世代前まで遡って参照している全ノードの名前を、近い順に返す。"""
+        return [self.names[i] for i in self.traverse(self.name2id[name], self.sources, depth)]
+
+    def neighbourhood(self, name, ancestors=1, descendants=1):
+        """
+        nameと、その参照先ancestors世代・参照元descendants世代までのノードからなる部分グラフを返す。
+        Return:
+            {"nodes": [{"name": 名前, "url": URL}, ...], "edges": [[参照元, 参照先], ...]}
+        """
+        start = self.name2id[name]
+        ids = [start]
+        ids += self.traverse(start, self.targets, ancestors)
+        ids += self.traverse(start, self.sources, descendants)
+        id_set = set(ids)
+        return {
+            "nodes": [{"name": self.names[i], "url": self.urls[i]} for i in ids],
+            "edges": [[self.names[i], self.names[t]] for i in ids for t in self.targets[i] if t in id_set]
+        }
+
+    def article(self, article):
+        """記事のノード一覧と、記事単位の参照先・参照元のエッジ数を返す。"""
+        return {
+            "name": article,
+            "nodes": [self.names[i] for i in self.article2nodes[article]],
+            "dependencies": dict(self.article_targets[article].most_common()),
+            "citers": dict(self.article_sources[article].most_common())
+        }
+
+    @staticmethod
+    def traverse(start, adjacency, depth=None):
+        """
+        startから幅優先探索し、depth世代までに到達したノードのIDを近い順に返す。startは含まない。
+        Args:
+            start: 探索を始めるノードのID
+            adjacency: self.targetsかself.sources
+            depth: 探索する世代数。Noneなら制限しない。
+        """
+        visited = {start}
+        found = list()
+        frontier = [start]
+        generation = 0
+        while frontier and (depth is None or generation < depth):
+            next_frontier = list()
+            for i in frontier:
+                for j in adjacency[i]:
+                    if j not in visited:
+                        visited.add(j)
+                        next_frontier.append(j)
+            found.extend(next_frontier)
+            frontier = next_frontier
+            generation += 1
+        return found
+
+
+def make_handler(index, extra_routes=None):
+    """
+    indexに問い合わせるBaseHTTPRequestHandlerのサブクラスを作る。
+    Args:
+        index: ReferenceIndex
+        extra_routes: 追加するエンドポイント。key=パス, value=クエリ(parse_qs()の結果)を受け取り結果を返す関数 の辞書。
+                      関数はKeyErrorで404、ValueErrorで400を返させることができる。
+    """
+
+    def name_param(params):
+        if "name" not in params:
+            raise ValueError("name is required")
+        return params["name"][0]
+
+    def optional_int(params, key, default=None):
+        return int(params[key][0]) if key in params else default
+
+    routes = {
+        "/node": lambda p: index.node(name_param(p)),
+        "/forward": lambda p: index.forward(name_param(p), optional_int(p, "depth")),
+        "/reverse": lambda p: index.reverse(name_param(p), optional_int(p, "depth")),
+        "/neighbourhood": lambda p: index.neighbourhood(name_param(p), optional_int(p, "ancestors", 1),
+                                                        optional_int(p, "descendants", 1)),
+        "/article": lambda p: index.article(name_param(p)),
+    }
+    if extra_routes is not None:
+        routes.update(extra_routes)
+
+    class ReferenceRequestHandler(BaseHTTPRequestHandler):
+        """引用関係の問い合わせに答えるハンドラ"""
+        protocol_version = "HTTP/1.1"
+        # ヘッダと本体を別々に書き込むので、keep-aliveの接続で応答が遅れないようにする
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                self.send_json(404, {"error": "unknown path: " + url.path})
+                return
+            try:
+                result = route(parse_qs(url.query))
+            except KeyError as e:
+                self.send_json(404, {"error": "not found: " + str(e.args[0])})
+                return
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.send_json(200, result)
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            # show_graph.html等、別のオリジンのページからも問い合わせられるようにする
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            # 1リクエストごとのログは出さない
+            pass
+
+    return ReferenceRequestHandler
+
+
+def serve(index, host="127.0.0.1", port=8000, extra_routes=None):
+    """
+    indexに問い合わせるHTTPサーバを起動する(終了するまで戻らない)。
+    extra_routesはmake_handler()を参照。
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(index, extra_routes))
+    server.daemon_threads = True
+    print(f"serving {len(index.names)} nodes on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="引用関係のグラフに問い合わせるHTTPサーバ")
+    parser.add_argument("input", help="parse_reference.pyの出力ファイル(.json, .ndjson, .csr, .sqlite)")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=8000, help="待ち受けるポート")
+    args = parser.parse_args()
+    serve(ReferenceIndex.load(args.input), args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
+import argparse
 import os
-import glob
+import json
+import re
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 MIZAR_LIBRARY_DIRECTORY_PATH = Path("mml")
+CATEGORIES = ['vocabularies', 'constructors', 'notations', 'registrations', 'theorems', 'schemes',
+              'definitions', 'requirements', 'expansions', 'equalities']
+# コメントを除いた行に"begin"で始まる単語があれば、そこで環境部が終わる
+BEGIN_PATTERN = re.compile(r"\bbegin")
 
 
-def make_library_dependency():
+def make_library_dependency(mml_dir=MIZAR_LIBRARY_DIRECTORY_PATH, workers=1):
     """
     各カテゴリ内で参照しているファイルを取得する。
+    各mizファイルは環境部(environ～begin)までしか読まない。
     Args:
+        mml_dir: mizファイルが置かれているディレクトリ
+        workers: ワーカープロセスの数。1なら逐次処理。
     Return:
         miz_file_dict: 各カテゴリ(vocabularies, constructors等)において、各ライブラリが
                        どのライブラリを参照しているかを示す辞書。
@@ -22,24 +33,67 @@ def make_library_dependency():
                         }
     """
     miz_files_dict = dict()
-    categories = ['vocabularies', 'constructors', 'notations', 'registrations', 'theorems', 'schemes',
-                  'definitions', 'requirements', 'expansions', 'equalities']
-    for category in categories:
+    for category in CATEGORIES:
         miz_files_dict[category] = dict()
 
-    cwd = os.getcwd()
-    try:
-        os.chdir(MIZAR_LIBRARY_DIRECTORY_PATH)
-        miz_files = glob.glob("*.miz")  # mmlディレクトリの.mizファイルを取り出す
-        
-        category_dict = create_key2list(categories)
+    miz_paths = sorted(Path(mml_dir).glob("*.miz"))  # mmlディレクトリの.mizファイルを取り出す
 
-    finally:
-        os.chdir(cwd)
+    if workers <= 1:
+        results = map(read_environ_articles, miz_paths)
+        for name, category2articles in results:
+            add_category2articles(miz_files_dict, name, category2articles)
+    else:
+        chunksize = max(1, len(miz_paths) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for name, category2articles in executor.map(read_environ_articles, miz_paths, chunksize=chunksize):
+                add_category2articles(miz_files_dict, name, category2articles)
 
     return miz_files_dict
 
 
+def add_category2articles(miz_files_dict, name, category2articles):
+    """
+    1つのmizファイルについてextract_articles()で得た結果をmiz_files_dictに追加する。
+    Args:
+        miz_files_dict: make_library_dependency()の出力。変更される。
+        name: mizファイルのarticle名(例:XBOOLE_0)
+        category2articles: extract_articles()の出力
+    """
+    for category, articles in category2articles.items():
+        miz_files_dict[category][name] = set(articles)
+
+
+def read_environ_articles(miz_path):
+    """
+    mizファイルを環境部(environ～begin)まで読み込み、各カテゴリで参照しているarticleを取得する。
+    プロセスプールのワーカーから呼び出せるよう、モジュールのトップレベルに置いている。
+    Args:
+        miz_path: mizファイルのパス
+    Return:
+        (article名(例:XBOOLE_0), extract_articles()の出力)
+    """
+    name = str.upper(Path(miz_path).stem)
+    return name, extract_articles(read_environ(miz_path))
+
+
+def read_environ(miz_path):
+    """
+    mizファイルの先頭からbeginを含む行までを読み込む。本体部(証明等)は読まない。
+    Args:
+        miz_path: mizファイルのパス
+    Return:
+        読み込んだ部分の文字列
+    """
+    environ_lines = list()
+    with open(miz_path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            environ_lines.append(line)
+            code = remove_comment(line) if "::" in line else line
+            if BEGIN_PATTERN.search(code):
+                break
+    return "".join(environ_lines)
+
+
 def extract_articles(contents):
     """
     mizファイルが環境部(environ~begin)で参照しているarticleを
@@ -149,3 +203,185 @@ def switch_to_true_only_select_key(key2bool, select_key):
         key2bool[k] = False
     key2bool[select_key] = True
     return key2bool
+
+
+class ArticleDependencyIndex:
+    """
+    article間の参照関係(make_library_dependency()の出力)から、推移的な依存関係を前計算した索引。
+    依存関係はarticleごとに1ビットを割り当てたビット集合(int)で持つので、
+    「XがYに(推移的に)依存しているか」はビット演算1回で、一覧もビットの個数に比例する時間で求まる。
+    カテゴリ名"all"は全カテゴリの和をとったグラフを表す。
+
+    Attributes:
+        articles: 全articleの名前のリスト。参照先が参照元より先に来る順(トポロジカル順)に並べる。
+                  循環がある場合、循環に含まれるarticleは最後に名前順で並べる。
+        article2id: key=article名, value=articlesでのインデックス の辞書。
+        ancestors: key=カテゴリ名, value=各articleが推移的に参照しているarticleのビット集合のリスト。
+        descendants: key=カテゴリ名, value=各articleを推移的に参照しているarticleのビット集合のリスト。
+    """
+
+    def __init__(self, miz_files_dict):
+        category2edges = dict()
+        names = set()
+        for category, name2articles in miz_files_dict.items():
+            category2edges[category] = name2articles
+            for name, articles in name2articles.items():
+                names.add(name)
+                names.update(articles)
+
+        all_edges = defaultdict(set)
+        for name2articles in category2edges.values():
+            for name, articles in name2articles.items():
+                all_edges[name].update(articles)
+        category2edges["all"] = all_edges
+
+        self.articles = sort_articles_topologically(sorted(names), all_edges)
+        self.article2id = {name: i for i, name in enumerate(self.articles)}
+
+        self.ancestors = dict()
+        self.descendants = dict()
+        for category, name2articles in category2edges.items():
+            targets = [list() for _ in self.articles]  # targets[i]: articleiが直接参照しているarticleのID
+            sources = [list() for _ in self.articles]  # sources[i]: articleiを直接参照しているarticleのID
+            for name, articles in name2articles.items():
+                i = self.article2id[name]
+                for a in articles:
+                    j = self.article2id[a]
+                    if i != j:
+                        targets[i].append(j)
+                        sources[j].append(i)
+            order = range(len(self.articles))
+            self.ancestors[category] = calc_transitive_closure(targets, order)
+            self.descendants[category] = calc_transitive_closure(sources, reversed(order))
+
+    def depends_on(self, article, category="all"):
+        """
+        articleが推移的に参照している全articleの名前を、トポロジカル順のリストで返す。
+        例: depends_on("ARYTM_0")
+        """
+        return self.bits2articles(self.ancestors[category][self.article2id[article]])
+
+    def affected_by(self, article, category="all"):
+        """
+        articleを推移的に参照している(articleが変更されると影響を受ける)全articleの名前を、
+        トポロジカル順のリストで返す。
+        例: affected_by("XBOOLE_0")
+        """
+        return self.bits2articles(self.descendants[category][self.article2id[article]])
+
+    def depends(self, article, dependency, category="all"):
+        """articleがdependencyを推移的に参照していればTrueを返す。"""
+        return bool(self.ancestors[category][self.article2id[article]] >> self.article2id[dependency] & 1)
+
+    def bits2articles(self, bits):
+        """ビット集合を、対応するarticleの名前のリスト(トポロジカル順)に変換する。"""
+        articles = list()
+        while bits:
+            low = bits & -bits
+            articles.append(self.articles[low.bit_length() - 1])
+            bits ^= low
+        return articles
+
+
+def sort_articles_topologically(names, edges):
+    """
+    articleを、参照先が参照元より先に来るように並べる(Kahnの方法)。
+    自分自身への参照は無視する。循環に含まれるarticleは最後に名前順で並べる。
+    Args:
+        names: 全articleの名前のリスト(名前順)
+        edges: key=article名, value=keyが参照しているarticle名の集合 の辞書
+    Return:
+        並べ替えた名前のリスト
+    """
+    dependents = defaultdict(list)
+    in_degree = dict.fromkeys(names, 0)  # 参照しているarticleのうち、まだ並べていないものの数
+    for name, articles in edges.items():
+        for a in articles:
+            if a != name:
+                dependents[a].append(name)
+                in_degree[name] += 1
+
+    queue = deque(name for name in names if in_degree[name] == 0)
+    ordered = list()
+    while queue:
+        name = queue.popleft()
+        ordered.append(name)
+        for d in dependents[name]:
+            in_degree[d] -= 1
+            if in_degree[d] == 0:
+                queue.append(d)
+
+    ordered_set = set(ordered)
+    ordered.extend(name for name in names if name not in ordered_set)
+    return ordered
+
+
+def calc_transitive_closure(targets, order):
+    """
+    各ノードから推移的に到達できるノードの集合を、ビット集合(int)で求める。
+    orderが参照先を先に処理する順になっていれば1回の走査で求まる。
+    循環がある場合は、変化がなくなるまで走査を繰り返す。
+    Args:
+        targets: targets[i]はノードiから直接到達できるノードのIDのリスト
+        order: ノードを処理する順(ノードIDのiterable)
+    Return:
+        closure: closure[i]はノードiから推移的に到達できるノードのビット集合。i自身は含まない。
+    """
+    order = list(order)
+    closure = [0] * len(targets)
+    changed = True
+    while changed:
+        changed = False
+        for i in order:
+            bits = closure[i]
+            for j in targets[i]:
+                bits |= closure[j] | (1 << j)
+            bits &= ~(1 << i)
+            if bits != closure[i]:
+                closure[i] = bits
+                changed = True
+    return closure
+
+
+def main(mml_dir=MIZAR_LIBRARY_DIRECTORY_PATH, workers=1, output_path="library_dependency.json",
+         depends_on=None, affected_by=None, category="all"):
+    """
+    全てのmizファイルの環境部から参照関係を取得し、JSONで出力する。
+    参照先の集合は名前順のリストにして出力する。
+    depends_on, affected_byが指定された場合は、そのarticleの推移的な参照先・参照元も表示する。
+    Args:
+        mml_dir: mizファイルが置かれているディレクトリ
+        workers: ワーカープロセスの数。1なら逐次処理。
+        output_path: 出力先のパス
+        depends_on: 推移的な参照先を表示したいarticle名
+        affected_by: 推移的な参照元を表示したいarticle名
+        category: depends_on, affected_byで使うカテゴリ名。"all"なら全カテゴリの和。
+    """
+    miz_files_dict = make_library_dependency(mml_dir, workers)
+    if depends_on or affected_by:
+        index = ArticleDependencyIndex(miz_files_dict)
+        if depends_on:
+            print(depends_on + " depends on: " + " ".join(index.depends_on(depends_on, category)))
+        if affected_by:
+            print(affected_by + " affects: " + " ".join(index.affected_by(affected_by, category)))
+
+    output = {category: {name: sorted(articles) for name, articles in name2articles.items()}
+              for category, name2articles in miz_files_dict.items()}
+    with open(output_path, mode='w') as f:
+        json.dump(output, f, indent=4)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MMLの各articleが環境部で参照しているarticleを取得する")
+    parser.add_argument("--mml-dir", default=MIZAR_LIBRARY_DIRECTORY_PATH, type=Path,
+                        help="mizファイルが置かれているディレクトリ")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="ワーカープロセスの数(0ならCPU数)")
+    parser.add_argument("-o", "--output", default="library_dependency.json", help="出力先のパス")
+    parser.add_argument("--depends-on", default=None, help="推移的な参照先を表示するarticle名(例:ARYTM_0)")
+    parser.add_argument("--affected-by", default=None, help="推移的な参照元を表示するarticle名(例:XBOOLE_0)")
+    parser.add_argument("--category", default="all", choices=CATEGORIES + ["all"],
+                        help="--depends-on, --affected-byで使うカテゴリ")
+    args = parser.parse_args()
+    main(args.mml_dir, args.workers or os.cpu_count() or 1, args.output,
+         args.depends_on, args.affected_by, args.category)
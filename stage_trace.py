@@ -0,0 +1,196 @@
+"""
+処理の段階ごとの実行時間とピークメモリ、件数などのカウンタを記録する。
+parse_reference.pyとdemo/create_graph.pyの--traceで使う。
+
+例:
+    tracer = StageTracer()
+    with tracer.span("remove_waste_edges"):
+        remove_waste_edges(node_list)
+    tracer.set_counter("edges", count_edges(node_list))
+    tracer.write_json("trace.json")
+    print(tracer.summary())
+
+計測しない場合はNULL_TRACERを渡す。spanやカウンタは何もしないので、呼び出し側で分岐せずに済む。
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageTracer:
+    """
+    段階(span)ごとの実行時間とピークメモリを記録する。
+    spanは入れ子にしてよい。外側のspanのピークメモリは内側のspanの実行中も含めた値になる。
+
+    Attributes:
+        spans: 終了したspanの記録(dict)のリスト。終了した順に並ぶ。
+               {"name", "start"(計測開始からの秒数), "seconds", "peak_memory_bytes", "memory_delta_bytes", "attrs"}
+               peak_memory_bytes, memory_delta_bytesはメモリを計測しない場合None。
+        counters: key=カウンタの名前, value=値 の辞書。
+        trace_memory: tracemallocでメモリを計測するかどうか。
+    """
+    enabled = True
+
+    def __init__(self, trace_memory=True):
+        self.spans = list()
+        self.counters = dict()
+        self.trace_memory = trace_memory
+        # 実行中のspanのピークメモリ。tracemallocのピークはspanの出入りのたびにリセットする
+        self._peak_stack = list()
+        self._origin = time.perf_counter()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def close(self):
+        """メモリの計測を終了する。"""
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        """
+        with文の中の処理を1つの段階として計測する。
+        Args:
+            name: 段階の名前
+            attrs: 記録に添える情報(記事の名前等)。JSONに書き出せる値にする。
+        """
+        start_memory = self._enter_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak, delta = self._exit_memory(start_memory)
+            self.spans.append({
+                "name": name,
+                "start": start - self._origin,
+                "seconds": seconds,
+                "peak_memory_bytes": peak,
+                "memory_delta_bytes": delta,
+                "attrs": attrs
+            })
+
+    def _enter_memory(self):
+        if not self.trace_memory:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        self._fold_peak(peak)
+        tracemalloc.reset_peak()
+        self._peak_stack.append(current)
+        return current
+
+    def _exit_memory(self, start_memory):
+        if not self.trace_memory:
+            return None, None
+        current, peak = tracemalloc.get_traced_memory()
+        span_peak = max(self._peak_stack.pop(), peak)
+        tracemalloc.reset_peak()
+        # 外側のspanにも内側のピークを反映する
+        self._fold_peak(span_peak)
+        return span_peak, current - start_memory
+
+    def _fold_peak(self, peak):
+        for i, p in enumerate(self._peak_stack):
+            if p < peak:
+                self._peak_stack[i] = peak
+
+    def add_span(self, name, seconds, peak_memory_bytes=None, **attrs):
+        """
+        別のプロセス等で計測した段階を記録する。
+        Args:
+            name: 段階の名前
+            seconds: 実行時間(秒)
+            peak_memory_bytes: ピークメモリ(byte)。計測していなければNone。
+            attrs: 記録に添える情報
+        """
+        self.spans.append({
+            "name": name,
+            "start": time.perf_counter() - self._origin - seconds,
+            "seconds": seconds,
+            "peak_memory_bytes": peak_memory_bytes,
+            "memory_delta_bytes": None,
+            "attrs": attrs
+        })
+
+    def count(self, name, n=1):
+        """カウンタnameにnを加える。"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        """カウンタnameの値をvalueにする。"""
+        self.counters[name] = value
+
+    def stage_totals(self):
+        """
+        段階の名前ごとに記録を集計する。
+        Return:
+            key=段階の名前, value={"calls", "seconds", "max_seconds", "peak_memory_bytes"} の辞書。
+            最初に現れた順に並ぶ。
+        """
+        totals = dict()
+        for s in self.spans:
+            t = totals.setdefault(s["name"], {"calls": 0, "seconds": 0.0, "max_seconds": 0.0,
+                                              "peak_memory_bytes": None})
+            t["calls"] += 1
+            t["seconds"] += s["seconds"]
+            t["max_seconds"] = max(t["max_seconds"], s["seconds"])
+            if s["peak_memory_bytes"] is not None:
+                t["peak_memory_bytes"] = max(t["peak_memory_bytes"] or 0, s["peak_memory_bytes"])
+        return totals
+
+    def to_dict(self):
+        """JSONに書き出せる辞書にする。"""
+        return {
+            "stages": self.stage_totals(),
+            "counters": self.counters,
+            "spans": self.spans
+        }
+
+    def write_json(self, path):
+        """記録をJSONファイルに書き出す。"""
+        with open(path, mode='w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def summary(self):
+        """
+        段階ごとの合計時間とピークメモリ、カウンタの値を表にした文字列を返す。
+        一番時間のかかった段階の行には*を付ける。
+        """
+        totals = self.stage_totals()
+        slowest = max(totals, key=lambda k: totals[k]["seconds"]) if totals else None
+        lines = [f"{'stage':<32}{'calls':>8}{'seconds':>12}{'max':>12}{'peak MiB':>10}"]
+        for name, t in totals.items():
+            peak = "-" if t["peak_memory_bytes"] is None else f"{t['peak_memory_bytes'] / 2 ** 20:.2f}"
+            mark = "*" if name == slowest else " "
+            lines.append(f"{mark}{name:<31}{t['calls']:>8}{t['seconds']:>12.4f}{t['max_seconds']:>12.4f}{peak:>10}")
+        for name, value in self.counters.items():
+            lines.append(f" {name:<31}{value:>8}")
+        return "\n".join(lines)
+
+
+class NullTracer:
+    """何も記録しないStageTracer。計測しない場合に使う。"""
+    enabled = False
+
+    @contextmanager
+    def span(self, name, **attrs):
+        yield
+
+    def add_span(self, name, seconds, peak_memory_bytes=None, **attrs):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def set_counter(self, name, value):
+        pass
+
+
+NULL_TRACER = NullTracer()